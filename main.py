@@ -26,12 +26,13 @@ def get_simdata(v):
     power = False               # select power based model
     dynamic = False             # dynamic doppler model (NO SUPPORT FOR STATIC DOPPLER IN exhaustive search)
     collision_method = "strict" # collision determination model, 2 options "strict" / "SINR"
+    locator = "candidates"      # FHS locator search, "exhaustive" / "vectorized" / "candidates" (same results) / "matched"
 
     numNodes = int(v)           # number of LRFHSS nodes on ground
 
     network = LoRaNetwork(numNodes, familyname, numOCW, numOBW, numGrids, CR, timeGranularity,
                           freqGranularity, simTime, numDecoders, use_earlydecode, use_earlydrop,
-                          use_headerdrop, collision_method)
+                          use_headerdrop, collision_method, locator=locator)
 
     avg_tracked_txs = 0         # tracked LRFHSS frames by gateway's decoders
     avg_decoded_bytes = 0       # decoded bytes
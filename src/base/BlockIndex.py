@@ -0,0 +1,119 @@
+import numpy as np
+
+
+def normalize_slices(start, stop, n: int) -> tuple:
+    """
+    Vectorized version of slice(start, stop).indices(n) for unit steps,
+    returns the clipped limits with stop >= start
+    """
+
+    start = np.asarray(start)
+    stop = np.asarray(stop)
+
+    start = np.where(start < 0, np.maximum(start + n, 0), np.minimum(start, n))
+    stop = np.where(stop < 0, np.maximum(stop + n, 0), np.minimum(stop, n))
+
+    return start, np.maximum(stop, start)
+
+
+class BlockIndex():
+    """
+    Summed area tables (integral images) over the indicator matrices of a received
+    matrix, the sum of any (f0:f1, t0:t1) block is obtained with four lookups.
+
+    Three indicators are supported:
+        'signal': rcvM == 1, single transmission
+        'collision': rcvM > 1, interferred slots
+        'occupied': rcvM > 0, any transmission
+
+    Args:
+        rcvM (np.ndarray): received matrix (numOCW, frequencySlots, simTime) or
+            a single OCW channel (frequencySlots, simTime).
+        kinds (tuple[str]): indicators to precompute, the rest are built on demand.
+        timeOffset (int): absolute time slot of the first matrix column, queries use absolute time slots.
+
+    Methods:
+        get_table(kind): summed area table for the given indicator.
+        block_sum(kind, ocw, f0, f1, t0, t1): sum over a single block.
+        count(kind, ocw, f0, f1, t0, t1): sums over a batch of blocks.
+        isCollided(ocw, f0, f1, t0, t1): strict collision status of a batch of blocks.
+    """
+
+    indicators = {
+        'signal': lambda m: m == 1,
+        'collision': lambda m: m > 1,
+        'occupied': lambda m: m > 0,
+    }
+
+    def __init__(self, rcvM: np.ndarray, kinds: tuple = ('signal',), timeOffset: int = 0) -> None:
+
+        self.rcvM = rcvM if rcvM.ndim == 3 else rcvM[np.newaxis]
+        self.timeOffset = timeOffset
+        self.numOCW, self.frequencySlots, self.simTime = self.rcvM.shape
+        self.dtype = np.int32 if self.frequencySlots * self.simTime < 2**31 else np.int64
+
+        self._tables = {}
+        for kind in kinds:
+            self.get_table(kind)
+
+
+    def get_table(self, kind: str) -> np.ndarray:
+        """
+        Summed area table with a leading row and column of zeros, shape (numOCW, F+1, T+1)
+        """
+
+        if kind not in self._tables:
+
+            if kind not in self.indicators:
+                raise Exception(f"Invalid block index indicator '{kind}'")
+
+            table = np.zeros((self.numOCW, self.frequencySlots + 1, self.simTime + 1), dtype=self.dtype)
+            for ocw in range(self.numOCW):
+                indicator = self.indicators[kind](self.rcvM[ocw])
+                np.cumsum(indicator, axis=0, dtype=self.dtype, out=table[ocw, 1:, 1:])
+                np.cumsum(table[ocw, 1:, 1:], axis=1, out=table[ocw, 1:, 1:])
+
+            self._tables[kind] = table
+
+        return self._tables[kind]
+
+
+    def block_sum(self, kind: str, ocw: int, f0: int, f1: int, t0: int, t1: int) -> int:
+        """
+        Sum of the indicator over rcvM[ocw, f0:f1, t0:t1], python slicing rules apply
+        """
+
+        S = self.get_table(kind)[ocw]
+        f0, f1, _ = slice(f0, f1).indices(self.frequencySlots)
+        t0, t1, _ = slice(t0 - self.timeOffset, t1 - self.timeOffset).indices(self.simTime)
+
+        if f1 <= f0 or t1 <= t0:
+            return 0
+
+        return int(S[f1, t1] - S[f0, t1] - S[f1, t0] + S[f0, t0])
+
+
+    def count(self, kind: str, ocw, f0, f1, t0, t1) -> np.ndarray:
+        """
+        Sums of the indicator over a batch of blocks rcvM[ocw, f0:f1, t0:t1],
+        python slicing rules apply to every block
+        """
+
+        S = self.get_table(kind)
+        f0, f1 = normalize_slices(f0, f1, self.frequencySlots)
+        t0, t1 = normalize_slices(np.asarray(t0) - self.timeOffset, np.asarray(t1) - self.timeOffset, self.simTime)
+
+        return S[ocw, f1, t1] - S[ocw, f0, t1] - S[ocw, f1, t0] + S[ocw, f0, t0]
+
+
+    def isCollided(self, ocw, f0, f1, t0, t1) -> np.ndarray:
+        """
+        Strict collision status of a batch of blocks, a block
+        is collided if any of its slots is not exactly 1
+        """
+
+        f0, f1 = normalize_slices(f0, f1, self.frequencySlots)
+        t0, t1 = normalize_slices(np.asarray(t0) - self.timeOffset, np.asarray(t1) - self.timeOffset, self.simTime)
+        t0, t1 = t0 + self.timeOffset, t1 + self.timeOffset
+
+        return self.count('signal', ocw, f0, f1, t0, t1) != (f1 - f0) * (t1 - t0)
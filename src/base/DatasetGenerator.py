@@ -3,18 +3,23 @@ import numpy as np
 from src.base.base import *
 from PIL import Image
 from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.MatrixBuilder import MatrixBuilder
+from src.base.HopTable import HopTable
+from src.base.DtypePolicy import DtypePolicy
+from src.base.DopplerModel import get_doppler_model
 from src.families.LR_FHSS_DriverMethod import LR_FHSS_DriverFamily
 
 
 class DatasetGenerator():
 
-    def __init__(self, CR, numOBW, freqGranularity, timeGranularity) -> None:
+    def __init__(self, CR, numOBW, freqGranularity, timeGranularity, dtype_policy="default") -> None:
 
         self.id = 0
         self.OCW = 0
         self.CR = CR
         self.TXpower_dB = TX_PWR_DB
         self.maxFrameT = MAX_FRM_TM
+        self.doppler = get_doppler_model()
         self.freqGranularity = freqGranularity # freq slots per OBW
         self.timeGranularity = timeGranularity # time slots per fragmet
 
@@ -43,6 +48,10 @@ class DatasetGenerator():
         self.header = np.ones((freqGranularity, self.headerSlots))  # header block
         self.fragment = np.ones((freqGranularity, timeGranularity)) # fragment block
 
+        self.dtypes = DtypePolicy.get_policy(dtype_policy)
+        self.builder = MatrixBuilder(1, self.frequencySlots, self.simTime, self.baseFreq,
+                                     freqGranularity, timeGranularity, self.headerSlots, self.dtypes)
+
         self.saveboxedimg = False
 
     def calculate_hdr_frg_times(self, time, numHeaders, numFragments) -> list[float]:
@@ -75,10 +84,10 @@ class DatasetGenerator():
         sequence = sequence[:seq_length]
 
         dis2sat = random.uniform(SAT_H, SAT_RANGE)
-        tau = get_visibility_time(dis2sat)
+        tau = self.doppler.visibility_time(dis2sat)
         time = random.uniform(-tau+self.maxFrameT, tau-self.maxFrameT)
         hdr_frg_times = self.calculate_hdr_frg_times(time, self.numHeaders, numFragments)
-        dynamicDoppler = [dopplerShift(t) for t in hdr_frg_times]
+        dynamicDoppler = self.doppler.shift(hdr_frg_times).tolist()
 
         tx = LRFHSSTransmission(self.id, self.id, startSlot, self.OCW, self.numHeaders,
                               payload_size, numFragments, sequence, seq_id, dis2sat,
@@ -97,37 +106,10 @@ class DatasetGenerator():
         return TXlist
     
 
-    def get_rcvM(self, transmissions: list[LRFHSSTransmission], dynamic: bool) -> np.ndarray:
-
-        rcvM = np.zeros((self.frequencySlots, self.simTime))
-
-        for tx in transmissions:
-
-            dopplershift = round(tx.dopplerShift[0] / self.freqPerSlot)
-
-            time = tx.startSlot
-            for fh, obw in enumerate(tx.sequence):
-
-                # variable doppler shift per header / fragment
-                if dynamic:
-                    dopplershift = round(tx.dopplerShift[fh] / self.freqPerSlot)
-
-                startFreq = self.baseFreq + obw * self.freqGranularity + dopplershift
-                endFreq = startFreq + self.freqGranularity
+    def get_rcvM(self, transmissions: list[LRFHSSTransmission], dynamic: bool, table: HopTable = None) -> np.ndarray:
 
-                # write header
-                if fh < tx.numHeaders:
-                    endTime = time + self.headerSlots
-                    rcvM[startFreq : endFreq, time : endTime] += (self.header)
-
-                # write fragment
-                else:
-                    endTime = time + self.timeGranularity
-                    rcvM[startFreq : endFreq, time : endTime] += (self.fragment)
-                
-                time = endTime
-
-        return rcvM
+        # all transmissions use the same OCW channel
+        return self.builder.get_rcvM(transmissions, power=False, dynamic=dynamic, table=table)[self.OCW]
 
 
     # returns an RGB image from collision matrix rcvM
@@ -146,19 +128,30 @@ class DatasetGenerator():
     # calcualte LR-FHSS signal coordiantes in spectogram as lower and upper frquency slot
     # and start and end time slot
     def get_boundingbox(self, tx: LRFHSSTransmission, dynamic:bool) -> list[int]:
+        return self.get_boundingboxes([tx], dynamic)[0]
+
 
-        totalSlots = self.headerSlots * tx.numHeaders + self.timeGranularity * tx.numFragments
-        endSlot = tx.startSlot + totalSlots - 1
+    # bounding boxes of a list of transmissions read from their hop table, the upper
+    # frequency uses the doppler shift of the first hop in the lowest OBW
+    def get_boundingboxes(self, transmissions: list[LRFHSSTransmission], dynamic: bool,
+                          table: HopTable = None) -> list[tuple]:
 
-        dopplershift_start = round(tx.dopplerShift[0] / self.freqPerSlot)
-        dopplershift_end = dopplershift_start
-        if dynamic:
-            dopplershift_end = round(tx.dopplerShift[tx.sequence.index(min(tx.sequence))] / self.freqPerSlot)
+        if table is None:
+            table = self.builder.get_hop_table(transmissions, dynamic)
 
-        lowerFreq = self.baseFreq + min(tx.sequence) * self.freqGranularity + dopplershift_start
-        upperFreq = self.baseFreq + max(tx.sequence) * self.freqGranularity + dopplershift_end
+        boxes = []
+        for k, tx in enumerate(transmissions):
+            h0, h1 = table.offsets[k], table.offsets[k+1]
+            obw = table.obw[h0:h1]
+            dopplershift = table.dopplershift[h0:h1]
 
-        return tx.startSlot, lowerFreq, endSlot, upperFreq
+            endSlot = int(table.endTime[h1 - 1]) - 1
+            lowerFreq = self.baseFreq + obw.min() * self.freqGranularity + dopplershift[0]
+            upperFreq = self.baseFreq + obw.max() * self.freqGranularity + dopplershift[np.argmin(obw)]
+
+            boxes.append((tx.startSlot, int(lowerFreq), endSlot, int(upperFreq)))
+
+        return boxes
     
 
     # Draw rectangle in image given the coordinates as a tuple xmin, ymin, xmax, ymax
@@ -202,7 +195,8 @@ class DatasetGenerator():
                 else:
                     transmissions = self.get_TXlist(numTX, numFragments)
 
-                rcvM = self.get_rcvM(transmissions, dynamic)
+                table = self.builder.get_hop_table(transmissions, dynamic)
+                rcvM = self.get_rcvM(transmissions, dynamic, table)
                 rcvM_RGB = self.get_RGBimg(rcvM)
                 image = Image.fromarray(rcvM_RGB, mode='RGB')
                 image.save(os.path.join(os.getcwd(), f"{dataset_name}\{img_name}.png"))
@@ -215,8 +209,8 @@ class DatasetGenerator():
                 })
 
                 annotation_id = 0
-                for tx in transmissions:
-                    x1, y1, x2, y2 = self.get_boundingbox(tx, dynamic)
+                boxes = self.get_boundingboxes(transmissions, dynamic, table)
+                for tx, (x1, y1, x2, y2) in zip(transmissions, boxes):
                     boxed_image = self.draw_rectangle(boxed_image, (x1, y1, x2, y2))
 
                     coco_json["annotations"].append({
@@ -0,0 +1,220 @@
+import numpy as np
+from src.base.Processor import Processor
+from src.base.LRFHSSTransmission import LRFHSSTransmission
+
+
+class DecoderPool():
+    """
+    Struct of arrays state of the gateway decoders. A single Processor holds the decoding
+    configuration and logic, the counters of every decoder are columns of a numpy array with
+    running totals, and all outcomes go to a single log in decoding order tagged with the
+    decoder that produced them.
+
+    Args:
+        numDecoders (int): number of decoders in the pool.
+        processor (Processor): decoding logic shared by all decoders.
+
+    Attributes:
+        processor (Processor): decoding logic shared by all decoders.
+        counters (np.ndarray): (numCounters, numDecoders) per decoder counters, rows as in counter_names.
+        totals (np.ndarray): per counter totals over all decoders.
+        decoded (list): decoded [tx, status] pairs, 1 means decoded payload.
+        decoded_by (list[int]): decoder of every decoded entry.
+        outcomes (list): [tx, outcome] of every tracked transmission.
+        outcomes_by (list[int]): decoder of every outcome entry.
+        decoded_headers (list[LRFHSSTransmission]): transmissions with a decoded header.
+        headers_by (list[int]): decoder of every decoded header.
+
+    Methods:
+        reset(): reset all counters and logs.
+        get_total(name): total of a counter over all decoders.
+        decode(i, tx, rcvM, dynamic, index, geometry): decode tx on decoder i, returns the free up time.
+        predecode_headers(i, tx, rcvM, dynamic, index, geometry): decode the headers of tx on decoder i.
+        commit(i, tx, outcome): record an outcome of decoder i.
+        commit_batch(decoders, transmissions, outcomes): record a batch of outcomes.
+        subset(lo, hi): new pool with the state of decoders lo:hi.
+        update(lo, pool): overwrite decoders lo:lo+len(pool) with the state of pool.
+        remap(transmissions): map the logged transmissions to the given objects by id.
+    """
+
+    counter_names = ('tracked_txs', 'decoded_bytes', 'header_drop_packets', 'decoded_hrd_pld',
+                     'decoded_hdr', 'decodable_pld', 'collided_hdr_pld')
+
+    # counter increased by every batch decode outcome
+    outcome_counters = {
+        Processor.HEADER_DROP: 'header_drop_packets',
+        Processor.DECODED_HDR_PLD: 'decoded_hrd_pld',  # case 1
+        Processor.DECODABLE_PLD: 'decodable_pld',      # case 2
+        Processor.DECODED_HDR: 'decoded_hdr',          # case 3
+        Processor.COLLIDED_HDR_PLD: 'collided_hdr_pld' # case 4
+    }
+
+    def __init__(self, numDecoders: int, processor: Processor) -> None:
+        self.numDecoders = numDecoders
+        self.processor = processor
+        self._rows = {name: k for k, name in enumerate(self.counter_names)}
+        self.reset()
+
+
+    def reset(self) -> None:
+        """
+        Reset all counters and logs to initial state
+        """
+        self.counters = np.zeros((len(self.counter_names), self.numDecoders), dtype=np.int64)
+        self.totals = np.zeros(len(self.counter_names), dtype=np.int64)
+        self.decoded = []
+        self.decoded_by = []
+        self.outcomes = []
+        self.outcomes_by = []
+        self.decoded_headers = []
+        self.headers_by = []
+
+
+    def __len__(self) -> int:
+        return self.numDecoders
+
+
+    def get_total(self, name: str) -> int:
+        return int(self.totals[self._rows[name]])
+
+
+    def _add(self, name: str, i: int, value: int) -> None:
+        self.counters[self._rows[name], i] += value
+        self.totals[self._rows[name]] += value
+
+
+    def commit(self, i: int, tx: LRFHSSTransmission, outcome: int) -> None:
+        """
+        Update counters and logs of decoder i with an outcome of tx
+        """
+
+        self._add('tracked_txs', i, 1)
+        self.outcomes.append([tx, int(outcome)])
+        self.outcomes_by.append(i)
+
+        if outcome in self.outcome_counters:
+            self._add(self.outcome_counters[outcome], i, 1)
+
+        if outcome == Processor.DECODED_HDR_PLD:
+            self._add('decoded_bytes', i, tx.payload_size)
+
+        if outcome in (Processor.DECODED_HDR_PLD, Processor.DECODED_HDR):
+            self.decoded.append([tx, int(outcome == Processor.DECODED_HDR_PLD)])
+            self.decoded_by.append(i)
+
+
+    def commit_batch(self, decoders: np.ndarray, transmissions: list[LRFHSSTransmission],
+                     outcomes: np.ndarray) -> None:
+        """
+        Same as commit over a batch of (decoder, tx, outcome) in decoding order
+        """
+
+        decoders = np.asarray(decoders, dtype=int)
+        outcomes = np.asarray(outcomes, dtype=int)
+        if len(decoders) == 0:
+            return
+
+        updates = np.zeros_like(self.counters)
+        np.add.at(updates[self._rows['tracked_txs']], decoders, 1)
+
+        for outcome, name in self.outcome_counters.items():
+            np.add.at(updates[self._rows[name]], decoders[outcomes == outcome], 1)
+
+        payload = np.array([tx.payload_size for tx in transmissions])
+        decodedPld = outcomes == Processor.DECODED_HDR_PLD
+        np.add.at(updates[self._rows['decoded_bytes']], decoders[decodedPld], payload[decodedPld])
+
+        self.counters += updates
+        self.totals += updates.sum(axis=1)
+
+        self.outcomes += [[tx, outcome] for tx, outcome in zip(transmissions, outcomes.tolist())]
+        self.outcomes_by += decoders.tolist()
+
+        for k in np.flatnonzero(decodedPld | (outcomes == Processor.DECODED_HDR)):
+            self.decoded.append([transmissions[k], int(decodedPld[k])])
+            self.decoded_by.append(int(decoders[k]))
+
+
+    def decode(self, i: int, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool,
+               index=None, geometry: tuple = None) -> int:
+        """
+        Decode tx on decoder i and return its free up time, see Processor.get_outcome
+        """
+        outcome, freeUpTime = self.processor.get_outcome(tx, rcvM, dynamic, index, geometry)
+        self.commit(i, tx, outcome)
+        return freeUpTime
+
+
+    def predecode_headers(self, i: int, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool,
+                          index=None, geometry: tuple = None) -> int:
+        """
+        Decode the headers of tx on decoder i and return its free up time, see Processor.get_header_outcome
+        """
+
+        decoded, freeUpTime = self.processor.get_header_outcome(tx, rcvM, dynamic, index, geometry)
+        if decoded:
+            self.decoded_headers.append(tx)
+            self.headers_by.append(i)
+
+        return freeUpTime
+
+
+    def subset(self, lo: int, hi: int) -> 'DecoderPool':
+        """
+        New pool with the counters and logged outcomes of decoders lo:hi, renumbered from 0
+        """
+
+        pool = DecoderPool(hi - lo, self.processor)
+        pool.counters = self.counters[:, lo : hi].copy()
+        pool.totals = pool.counters.sum(axis=1)
+
+        for tx_status, i in zip(self.decoded, self.decoded_by):
+            if lo <= i < hi:
+                pool.decoded.append(tx_status)
+                pool.decoded_by.append(i - lo)
+
+        for tx_outcome, i in zip(self.outcomes, self.outcomes_by):
+            if lo <= i < hi:
+                pool.outcomes.append(tx_outcome)
+                pool.outcomes_by.append(i - lo)
+
+        for tx, i in zip(self.decoded_headers, self.headers_by):
+            if lo <= i < hi:
+                pool.decoded_headers.append(tx)
+                pool.headers_by.append(i - lo)
+
+        return pool
+
+
+    def update(self, lo: int, pool: 'DecoderPool') -> None:
+        """
+        Overwrite the state of decoders lo:lo+len(pool) with the state of pool
+        """
+
+        hi = lo + len(pool)
+        self.counters[:, lo : hi] = pool.counters
+        self.totals = self.counters.sum(axis=1)
+
+        keep = [k for k, i in enumerate(self.decoded_by) if not lo <= i < hi]
+        self.decoded = [self.decoded[k] for k in keep] + pool.decoded
+        self.decoded_by = [self.decoded_by[k] for k in keep] + [i + lo for i in pool.decoded_by]
+
+        keep = [k for k, i in enumerate(self.outcomes_by) if not lo <= i < hi]
+        self.outcomes = [self.outcomes[k] for k in keep] + pool.outcomes
+        self.outcomes_by = [self.outcomes_by[k] for k in keep] + [i + lo for i in pool.outcomes_by]
+
+        keep = [k for k, i in enumerate(self.headers_by) if not lo <= i < hi]
+        self.decoded_headers = [self.decoded_headers[k] for k in keep] + pool.decoded_headers
+        self.headers_by = [self.headers_by[k] for k in keep] + [i + lo for i in pool.headers_by]
+
+
+    def remap(self, transmissions: list[LRFHSSTransmission]) -> None:
+        """
+        Replace the logged transmissions with the given ones by id,
+        used on copies of the transmissions decoded by pool workers
+        """
+
+        original = {tx.id: tx for tx in transmissions}
+        self.decoded = [[original[tx.id], status] for tx, status in self.decoded]
+        self.outcomes = [[original[tx.id], outcome] for tx, outcome in self.outcomes]
+        self.decoded_headers = [original[tx.id] for tx in self.decoded_headers]
@@ -0,0 +1,117 @@
+import heapq
+import random
+import numpy as np
+
+
+class DecoderScheduler():
+    """
+    Assignment of transmissions to the gateway decoders. Busy decoders are kept in a
+    min-heap of (freeUpTime, index) and free decoders in a pool ordered by the policy,
+    so every assignment costs O(log numDecoders) instead of a scan over all decoders.
+    Transmissions are expected in start time order, as in TXset, an earlier start time
+    rebuilds the pools from the free up times.
+
+    Policies:
+        'firstfit': free decoder with the lowest index, same choice as the linear scan.
+        'leastloaded': free decoder with the fewest assigned transmissions, lowest index on ties.
+        'random': free decoder chosen uniformly at random.
+
+    Args:
+        numDecoders (int): number of decoders in the gateway.
+        policy (str): assignment policy.
+        freeUpTimes (np.ndarray): initial free up times, nan for decoders never freed, all free if None.
+
+    Attributes:
+        freeUpTimes (np.ndarray): current free up time of each decoder.
+        loads (np.ndarray): transmissions assigned to each decoder.
+
+    Methods:
+        acquire(time): index of the decoder assigned to a transmission starting at time, None if all busy.
+        release(i, freeUpTime): set the free up time of decoder i, None if it is never freed.
+    """
+
+    policies = ('firstfit', 'leastloaded', 'random')
+
+    def __init__(self, numDecoders: int, policy: str = "firstfit", freeUpTimes: np.ndarray = None) -> None:
+
+        if policy not in self.policies:
+            raise Exception(f"Invalid scheduler policy '{policy}'")
+
+        self.policy = policy
+        self.freeUpTimes = np.zeros(numDecoders) if freeUpTimes is None else np.asarray(freeUpTimes, dtype=float)
+        self.loads = np.zeros(numDecoders, dtype=int)
+        self._rebuild(-np.inf)
+
+
+    def _rebuild(self, time: float) -> None:
+
+        self.time = time
+        self._busy = []
+        self._free = []
+
+        for i, fut in enumerate(self.freeUpTimes):
+            if np.isnan(fut):
+                continue
+            if fut <= time:
+                self._push_free(i)
+            else:
+                self._busy.append((fut, i))
+
+        heapq.heapify(self._busy)
+
+
+    def _push_free(self, i: int) -> None:
+
+        if self.policy == 'firstfit':
+            heapq.heappush(self._free, i)
+        elif self.policy == 'leastloaded':
+            heapq.heappush(self._free, (self.loads[i], i))
+        else:
+            self._free.append(i)
+
+
+    def _pop_free(self) -> int:
+
+        if self.policy == 'firstfit':
+            return heapq.heappop(self._free)
+        elif self.policy == 'leastloaded':
+            return heapq.heappop(self._free)[1]
+
+        # swap with the last one and pop
+        k = random.randrange(len(self._free))
+        self._free[k], self._free[-1] = self._free[-1], self._free[k]
+        return self._free.pop()
+
+
+    def acquire(self, time: int) -> int:
+        """
+        Return the decoder for a transmission starting at time, None if all decoders are busy
+        """
+
+        if time < self.time:
+            self._rebuild(time)
+        self.time = time
+
+        while len(self._busy) and self._busy[0][0] <= time:
+            _, i = heapq.heappop(self._busy)
+            self._push_free(i)
+
+        if len(self._free) == 0:
+            return None
+
+        i = self._pop_free()
+        self.loads[i] += 1
+        return i
+
+
+    def release(self, i: int, freeUpTime: int) -> None:
+        """
+        Set the free up time of decoder i after its assignment, None if it is never freed
+        """
+
+        if freeUpTime is None:
+            self.freeUpTimes[i] = np.nan
+            return
+
+        self.freeUpTimes[i] = freeUpTime
+        heapq.heappush(self._busy, (freeUpTime, i))
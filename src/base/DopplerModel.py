@@ -0,0 +1,80 @@
+import numpy as np
+from src.base.base import *
+
+
+class DopplerModel():
+    """
+    Doppler shift seen from the nodes as a function of time, tabulated once over
+    [-maxTime, maxTime] seconds. The shift is monotone increasing in time, so shifts
+    are looked up with linear interpolation and times with a binary search.
+
+    Args:
+        maxTime (float): half width of the tabulated time window in seconds.
+        points (int): number of table points.
+
+    Attributes:
+        T (np.ndarray): table times, evenly spaced.
+        DS (np.ndarray): doppler shift at every table time, in Hz.
+        step (float): time between table points.
+
+    Methods:
+        shift(t): doppler shift at times t, interpolated.
+        index(shift): table index of the given shifts, same as bisection over DS.
+        time(shift): time of the given shifts, interpolated.
+        visibility_time(d): half satellite visibility time for node-satellite distances d.
+    """
+
+    def __init__(self, maxTime: float, points: int) -> None:
+        self.maxTime = maxTime
+        self.points = points
+        self.T = np.linspace(-maxTime, maxTime, points)
+        self.DS = dopplerShift(self.T)
+        self.step = self.T[1] - self.T[0]
+
+
+    def shift(self, t) -> np.ndarray:
+        """
+        Doppler shift at times t, times outside the table are clipped to its limits
+        """
+        return np.interp(t, self.T, self.DS)
+
+
+    def index(self, shift) -> np.ndarray:
+        """
+        Index j of the table such that shift is between DS[j] and DS[j+1], -1 below
+        and len(DS) above the table range, as bisection(DS, shift) does
+        """
+
+        j = np.searchsorted(self.DS, shift, side='right') - 1
+        return np.where(np.asarray(shift) > self.DS[-1], len(self.DS), j)
+
+
+    def time(self, shift) -> np.ndarray:
+        """
+        Time at which the given doppler shifts are seen, shifts outside the table are clipped to its limits
+        """
+        return np.interp(shift, self.DS, self.T)
+
+
+    @staticmethod
+    def visibility_time(d) -> np.ndarray:
+        return get_visibility_time(d)
+
+
+_models = {}
+
+def get_doppler_model(maxTime: float = None, points: int = 2**16) -> DopplerModel:
+    """
+    Shared doppler model for the given table, built once per process. The default table
+    covers the visibility window of the farthest node plus a maximum frame duration on
+    each side, every header/fragment of a visible node falls inside it
+    """
+
+    if maxTime is None:
+        maxTime = get_visibility_time(SAT_RANGE) + 2 * MAX_FRM_TM
+
+    key = (maxTime, points)
+    if key not in _models:
+        _models[key] = DopplerModel(maxTime, points)
+
+    return _models[key]
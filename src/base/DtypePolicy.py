@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class DtypePolicy():
+    """
+    Data types used by the simulation matrices.
+
+    Args:
+        count (np.dtype): count based received matrices.
+        power (np.dtype): power based received matrices and power estimations.
+        binary (np.dtype): binary matrices searched by the FHS locator.
+
+    Methods:
+        get_policy(name): predefined policy, "default", "compact" or "compact16".
+        accumulator(dtype): data type used to accumulate blocks for the given output type.
+        saturate(m, dtype): cast accumulated counts to dtype, clipping at its maximum value.
+    """
+
+    def __init__(self, count=np.float64, power=np.float64, binary=np.float64) -> None:
+        self.count = np.dtype(count)
+        self.power = np.dtype(power)
+        self.binary = np.dtype(binary)
+
+
+    @staticmethod
+    def get_policy(name):
+        """
+        Return predefined policy, policy objects are returned unchanged
+        """
+
+        if isinstance(name, DtypePolicy):
+            return name
+
+        if name == "default":
+            return DtypePolicy(np.float64, np.float64, np.float64)
+
+        elif name == "compact":
+            return DtypePolicy(np.uint8, np.float32, bool)
+
+        elif name == "compact16":
+            return DtypePolicy(np.uint16, np.float32, bool)
+
+        else:
+            raise Exception(f"Invalid dtype policy '{name}'")
+
+
+    @staticmethod
+    def accumulator(dtype) -> np.dtype:
+        """
+        Unsigned counts are accumulated in the next wider unsigned type, the
+        modular arithmetic of the difference array cancels out as long as the
+        true counts fit in it, other types are accumulated as they are
+        """
+
+        dtype = np.dtype(dtype)
+        if dtype.kind == 'u' and dtype.itemsize < 8:
+            return np.dtype(f'uint{dtype.itemsize * 16}')
+        return dtype
+
+
+    @staticmethod
+    def saturate(m: np.ndarray, dtype) -> np.ndarray:
+        """
+        Cast accumulated counts to dtype without wrapping around
+        """
+
+        dtype = np.dtype(dtype)
+        if m.dtype == dtype:
+            return m
+
+        if dtype.kind == 'u':
+            m = np.minimum(m, np.iinfo(dtype).max)
+
+        return m.astype(dtype)
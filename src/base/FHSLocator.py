@@ -1,6 +1,10 @@
 import numpy as np
 from multiprocessing import Pool
 from src.base.base import *
+from src.base.BlockIndex import BlockIndex, normalize_slices
+from src.base.DopplerModel import get_doppler_model
+from src.base.TransmissionTable import TransmissionTable
+from src.base.TemplateBank import TemplateBank
 
 
 class FHSLocator():
@@ -21,19 +25,339 @@ class FHSLocator():
         self.fragmentSize = timeGranularity * freqGranularity # time-freq frg size
 
         self.receivedMatrix = np.zeros(1)
+        self.index = None
         self.min_seqlength = 11 # CHANGE HERE FOR DIFFERENT CR cr1=11
 
         maxtau = get_visibility_time(SAT_RANGE)
-        self.T = np.linspace(-maxtau, maxtau, 100*simTime)
-        self.DS = np.asarray([dopplerShift(t) for t in self.T])
+        self.doppler = get_doppler_model(maxtau, 100*simTime)
+        self.T = self.doppler.T
+        self.DS = self.doppler.DS
 
         self.maxDopplerSlots = round(self.DS[-1] / freqPerSlot)
-        self.DSperHdr = round(HDR_TIME / (self.T[1] - self.T[0]))
-        self.DSperFrg = round(FRG_TIME / (self.T[1] - self.T[0]))
+        self.DSperHdr = round(HDR_TIME / self.doppler.step)
+        self.DSperFrg = round(FRG_TIME / self.doppler.step)
+
+        # doppler shift of every table point in frequency slots and table
+        # index of every searched static shift, looked up per candidate
+        self.DSslots = np.round(self.DS / freqPerSlot).astype(int)
+        self.staticShifts = np.arange(-self.maxDopplerSlots, self.maxDopplerSlots)
+        self.staticShiftIdx = self.doppler.index(self.staticShifts * freqPerSlot)
+
+        self.bank = None # precomputed hop windows, see set_template_bank
 
     
     def set_RXmatrix(self, RXMatrix: np.ndarray):
         self.receivedMatrix = RXMatrix
+        self.index = BlockIndex(np.asarray(RXMatrix))
+
+
+    def get_template_freqs(self, seqs) -> np.ndarray:
+        """
+        Hop windows of the given sequences from the template bank,
+        built in memory if any sequence is out of the bank
+        """
+
+        rows = [self.bank.get_row(seq) for seq in seqs] if self.bank is not None else [-1]
+        if min(rows) >= 0:
+            return self.bank.freqs[rows]
+
+        return TemplateBank.build(self, seqs)
+
+
+    def get_fit_lengths(self, fits: np.ndarray) -> tuple:
+        """
+        Outcome of isPossibeShift for a (numT, numHops) array of hop fits, returns the fit
+        status and estimated length of every row. Hops after the first miss are ignored,
+        a missed header rejects the row and a missed fragment accepts it if at least
+        min_seqlength hops fit
+        """
+
+        fitness = np.cumprod(fits, axis=1).sum(axis=1)
+        return self.get_prefix_fit(fitness, fits.shape[1])
+
+
+    def get_prefix_fit(self, fitness: np.ndarray, numHops: int) -> tuple:
+        """
+        Fit status and estimated length from the number of hops fitted before the first
+        miss, the fit rules of get_fit_lengths
+        """
+
+        complete = fitness == numHops
+        truncated = (fitness >= self.numHeaders) & (fitness >= self.min_seqlength)
+        fit = complete | truncated
+
+        return fit, np.where(fit, fitness, 0)
+
+
+    def get_estTXs_vectorized(self, input):
+        """
+        Vectorized exhaustive FHS locator, same output as get_estTXs. For every (sequence, doppler start)
+        the hop fits of all start times are read from the summed area table as a (numT, numHops) array
+        """
+
+        seqs, shift = input
+        seqs = list(seqs)
+        if len(seqs) == 0:
+            return []
+
+        freqs = self.get_template_freqs(seqs)
+        timeOffsets, timeLengths = TemplateBank.get_hop_timing(self, freqs.shape[2])
+        minSignal = np.where(np.arange(freqs.shape[2]) < self.numHeaders, self.headerSize, self.fragmentSize)
+
+        startTimes = np.arange(self.simTime - self.max_packet_duration)
+
+        estT, estS, estLen = [], [], []
+        for s, seq in enumerate(seqs):
+
+            L = len(seq)
+            t0 = startTimes[:, np.newaxis] + timeOffsets[np.newaxis, :L]
+            t1 = t0 + timeLengths[np.newaxis, :L]
+
+            # first hop of every (doppler start, start time) at once, a missed
+            # first hop rejects the pair so only the remaining rows are checked
+            f0 = self.baseFreq + freqs[s, :, 0].astype(int)[:, np.newaxis]
+            firstHop = self.index.count('signal', 0, f0, f0 + self.freqGranularity + 1,
+                                        t0[np.newaxis, :, 0], t1[np.newaxis, :, 0]) >= minSignal[0]
+
+            # estimated length per start time, doppler starts in search order, first fit wins
+            found = np.zeros(len(startTimes), dtype=bool)
+            length = np.zeros(len(startTimes), dtype=int)
+            for d in np.flatnonzero(firstHop.any(axis=1)):
+
+                candidates = np.flatnonzero(firstHop[d] & ~found)
+                if len(candidates) == 0:
+                    continue
+
+                f0 = self.baseFreq + freqs[s, d, :L].astype(int)
+                signal = self.index.count('signal', 0, f0[np.newaxis, :], f0[np.newaxis, :] + self.freqGranularity + 1,
+                                          t0[candidates], t1[candidates])
+
+                fit, fitLength = self.get_fit_lengths(signal >= minSignal[np.newaxis, :L])
+                length[candidates[fit]] = fitLength[fit]
+                found[candidates[fit]] = True
+
+            t = np.flatnonzero(found)
+            estT.append(t)
+            estS.append(np.full(len(t), s + shift))
+            estLen.append(length[t])
+
+        # (t, s) order of get_estTXs
+        estT, estS, estLen = np.concatenate(estT), np.concatenate(estS), np.concatenate(estLen)
+        order = np.lexsort((estS, estT))
+
+        return list(zip(estT[order].tolist(), estS[order].tolist(), estLen[order].tolist()))
+
+
+    def get_fit_maps(self, fmin: int, fmax: int, numTime: int) -> np.ndarray:
+        """
+        Header (0) and fragment (1) fit of the hop window starting at every frequency slot
+        fmin..fmax and time slot 0..numTime-1, shape (2, fmax-fmin+1, numTime). A window
+        fits if all its slots carry a single transmission, as in isPossibeShift
+        """
+
+        startFreq = np.arange(fmin, fmax + 1)[:, np.newaxis]
+        time = np.arange(numTime)[np.newaxis, :]
+
+        maps = np.zeros((2, len(startFreq), numTime), dtype=bool)
+        for k, (timeLength, minSignal) in enumerate(((self.headerSlots, self.headerSize),
+                                                     (self.timeGranularity, self.fragmentSize))):
+
+            # row chunks bound the size of the lookup temporaries
+            for f in range(0, len(startFreq), 1024):
+                f0 = startFreq[f : f + 1024]
+                signal = self.index.count('signal', 0, f0, f0 + self.freqGranularity + 1, time, time + timeLength)
+                maps[k, f : f + 1024] = signal >= minSignal
+
+        return maps
+
+
+    def get_score_map(self, seqs) -> tuple:
+        """
+        Matched filter scores of the given sequences, every (sequence, doppler start) hop pattern
+        is a sparse template correlated with the received matrix by shift and multiply of its hop
+        fits. The score is the number of hops fitted before the first miss, zero unless the fit
+        rules of get_fit_lengths accept it, so all headers must fit. Returns the score of the first
+        doppler start (bank index) that fits, in search order, and that doppler start, both with
+        shape (numSeqs, numT)
+        """
+
+        seqs = list(seqs)
+        freqs = self.get_template_freqs(seqs).astype(int) + self.baseFreq
+        timeOffsets, _ = TemplateBank.get_hop_timing(self, freqs.shape[2])
+        numT = self.simTime - self.max_packet_duration
+
+        lengths = [len(seq) for seq in seqs]
+        fmin = min(int(freqs[s, :, :L].min()) for s, L in enumerate(lengths))
+        fmax = max(int(freqs[s, :, :L].max()) for s, L in enumerate(lengths))
+        maps = self.get_fit_maps(fmin, fmax, numT + int(timeOffsets[-1]))
+
+        fitScore = np.zeros((len(seqs), numT), dtype=int)
+        best = np.zeros((len(seqs), numT), dtype=int)
+        for s, L in enumerate(lengths):
+
+            # (numDopplerStarts, numT) correlation, one shifted row per hop, a miss ends the prefix
+            fitting = np.ones((freqs.shape[1], numT), dtype=bool)
+            score = np.zeros((freqs.shape[1], numT), dtype=int)
+            for h in range(L):
+                kind = 0 if h < self.numHeaders else 1
+                fitting &= maps[kind, freqs[s, :, h] - fmin, timeOffsets[h] : timeOffsets[h] + numT]
+                if not fitting.any():
+                    break
+                score += fitting
+
+            fit, score = self.get_prefix_fit(score, L)
+            best[s] = fit.argmax(axis=0)
+            fitScore[s] = score[best[s], np.arange(numT)]
+
+        return fitScore, best
+
+
+    def get_estTXs_matched(self, input, threshold: int = None):
+        """
+        Matched filter FHS locator, detections are the (t, s) pairs with a fitting doppler start
+        whose score also reaches threshold hops if given, the score is the estimated length.
+        Output as get_estTXs, sorted by (t, s)
+        """
+
+        seqs, shift = input
+        if len(seqs) == 0:
+            return []
+
+        fitScore, _ = self.get_score_map(seqs)
+        s, t = np.nonzero((fitScore > 0) & (fitScore >= (threshold or 0)))
+        order = np.lexsort((s, t))
+
+        return list(zip(t[order].tolist(), (s[order] + shift).tolist(), fitScore[s, t][order].tolist()))
+
+
+    def get_header_map(self, fmin: int, fmax: int, numTime: int) -> np.ndarray:
+        """
+        Header fit of the window starting at every frequency slot fmin..fmax and time slot
+        0..numTime-1, shape (fmax-fmin+1, numTime). Start times are first pruned with a column
+        occupancy index: a window column holds at most min(column signal, freqGranularity+1)
+        single transmission slots, start times whose bound is below headerSize are never checked
+        """
+
+        S = self.index.get_table('signal')[0]
+        F, T = S.shape[0] - 1, S.shape[1] - 1
+
+        # occupancy bound of every window, time limits clipped as in block_sum
+        colSignal = np.minimum(np.diff(S[F]), self.freqGranularity + 1)
+        colBound = np.concatenate(([0], np.cumsum(colSignal)))
+        time = np.arange(numTime)
+        t0, t1 = normalize_slices(time, time + self.headerSlots, T)
+        occupied = time[colBound[t1] - colBound[t0] >= self.headerSize]
+
+        startFreq = np.arange(fmin, fmax + 1)[:, np.newaxis]
+        hdrMap = np.zeros((len(startFreq), numTime), dtype=bool)
+
+        # row chunks bound the size of the lookup temporaries
+        for f in range(0, len(startFreq), 1024):
+            f0 = startFreq[f : f + 1024]
+            signal = self.index.count('signal', 0, f0, f0 + self.freqGranularity + 1,
+                                      occupied[np.newaxis, :], occupied[np.newaxis, :] + self.headerSlots)
+            hdrMap[f : f + 1024, occupied] = signal >= self.headerSize
+
+        return hdrMap
+
+
+    def get_candidates(self, seqs, freqs: np.ndarray = None) -> tuple:
+        """
+        (t, s, d) candidates of the given sequences whose first one or two headers fit, with d the
+        doppler start as bank index, sorted by (s, d, t). Only these triples can pass isPossibeShift
+        """
+
+        seqs = list(seqs)
+        if freqs is None:
+            freqs = self.get_template_freqs(seqs)
+
+        freqs = freqs.astype(int) + self.baseFreq
+        timeOffsets, _ = TemplateBank.get_hop_timing(self, freqs.shape[2])
+        numT = self.simTime - self.max_packet_duration
+        numHdrs = min(2, self.numHeaders)
+
+        if numHdrs == 0:
+            # no header to index, every triple is a candidate
+            s, d, t = np.indices((len(seqs), freqs.shape[1], numT)).reshape(3, -1)
+            return t, s, d
+
+        fmin = int(freqs[:, :, :numHdrs].min())
+        fmax = int(freqs[:, :, :numHdrs].max())
+        hdrMap = self.get_header_map(fmin, fmax, numT + int(timeOffsets[numHdrs - 1]))
+
+        candT, candS, candD = [], [], []
+        for s in range(len(seqs)):
+
+            fits = np.ones((freqs.shape[1], numT), dtype=bool)
+            for h in range(numHdrs):
+                fits &= hdrMap[freqs[s, :, h] - fmin, timeOffsets[h] : timeOffsets[h] + numT]
+
+            d, t = np.nonzero(fits)
+            candT.append(t)
+            candS.append(np.full(len(t), s))
+            candD.append(d)
+
+        return np.concatenate(candT), np.concatenate(candS), np.concatenate(candD)
+
+
+    def get_estTXs_candidates(self, input):
+        """
+        FHS locator with candidate generation, same output as get_estTXs. Only the (t, s, d)
+        triples from get_candidates are verified, all hops of a sequence in a single batch lookup
+        """
+
+        seqs, shift = input
+        seqs = list(seqs)
+        if len(seqs) == 0:
+            return []
+
+        freqs = self.get_template_freqs(seqs)
+        timeOffsets, timeLengths = TemplateBank.get_hop_timing(self, freqs.shape[2])
+        minSignal = np.where(np.arange(freqs.shape[2]) < self.numHeaders, self.headerSize, self.fragmentSize)
+
+        candT, candS, candD = self.get_candidates(seqs, freqs)
+        bounds = np.searchsorted(candS, np.arange(len(seqs) + 1))
+
+        estT, estS, estLen = [], [], []
+        for s, seq in enumerate(seqs):
+
+            t, d = candT[bounds[s] : bounds[s+1]], candD[bounds[s] : bounds[s+1]]
+            if len(t) == 0:
+                continue
+
+            L = len(seq)
+            f0 = self.baseFreq + freqs[s][d, :L].astype(int)
+            t0 = t[:, np.newaxis] + timeOffsets[np.newaxis, :L]
+            t1 = t0 + timeLengths[np.newaxis, :L]
+            signal = self.index.count('signal', 0, f0, f0 + self.freqGranularity + 1, t0, t1)
+
+            fit, fitLength = self.get_fit_lengths(signal >= minSignal[np.newaxis, :L])
+
+            # candidates are sorted by d, the first fit of every t is the first doppler start that fits
+            t, fitLength = t[fit], fitLength[fit]
+            t, first = np.unique(t, return_index=True)
+
+            estT.append(t)
+            estS.append(np.full(len(t), s + shift))
+            estLen.append(fitLength[first])
+
+        if len(estT) == 0:
+            return []
+
+        # (t, s) order of get_estTXs
+        estT, estS, estLen = np.concatenate(estT), np.concatenate(estS), np.concatenate(estLen)
+        order = np.lexsort((estS, estT))
+
+        return list(zip(estT[order].tolist(), estS[order].tolist(), estLen[order].tolist()))
+
+
+    def set_template_bank(self, seqs, family: str, region: str, directory: str) -> TemplateBank:
+        """
+        Load (or build and save) the template bank of the given sequences, sequences
+        found in the bank are searched with table lookups instead of doppler arithmetic
+        """
+        self.bank = TemplateBank.load(self, seqs, family, region, directory)
+        return self.bank
 
 
     def fits(self, subm: np.ndarray, isHeader: bool) -> bool:
@@ -45,7 +369,7 @@ class FHSLocator():
         else:        return (subm == 1).sum() >= self.fragmentSize
     
 
-    def get_estTXs_parallel(self, seqs):
+    def get_estTXs_parallel(self, seqs, method: str = "exhaustive"):
 
         _input = []
         subseq = int(len(seqs) / 16)
@@ -56,8 +380,19 @@ class FHSLocator():
             i += subseq
             k += 1
 
+        if method == "exhaustive":
+            locate = self.get_estTXs
+        elif method == "vectorized":
+            locate = self.get_estTXs_vectorized
+        elif method == "matched":
+            locate = self.get_estTXs_matched
+        elif method == "candidates":
+            locate = self.get_estTXs_candidates
+        else:
+            raise Exception(f"Invalid FHS locator method '{method}'")
+
         pool = Pool(processes = 16)
-        result = pool.map(self.get_estTXs, _input)
+        result = pool.map(locate, _input)
         pool.close()
         pool.join()
 
@@ -74,18 +409,31 @@ class FHSLocator():
         """
 
         seqs, shift = input
+
+        # template bank row of every sequence, -1 for the ones searched without the bank
+        rows = [self.bank.get_row(seq) if self.bank is not None else -1 for seq in seqs]
         
         estTXs = []
         for t in range(self.simTime - self.max_packet_duration):
             for s, seq in enumerate(seqs):
 
                 possibleShift = []
-                for DS in range(-self.maxDopplerSlots, self.maxDopplerSlots, 1):
+                if rows[s] >= 0:
+                    # only the shifts whose first hop fits are checked, in search order
+                    for d in self.get_template_candidates(rows[s], t):
 
-                    fits, estLen = self.isPossibeShift(DS, t, seq)
-                    if fits:
-                        possibleShift.append(DS)
-                        break # select first possible Doppler Shift that fits seq s at time t
+                        fits, estLen = self.isPossibleTemplate(rows[s], d, t)
+                        if fits:
+                            possibleShift.append(d - self.maxDopplerSlots)
+                            break
+
+                else:
+                    for DS in range(-self.maxDopplerSlots, self.maxDopplerSlots, 1):
+
+                        fits, estLen = self.isPossibeShift(DS, t, seq)
+                        if fits:
+                            possibleShift.append(DS)
+                            break # select first possible Doppler Shift that fits seq s at time t
 
                 if len(possibleShift) > 0:
                     estTXs.append((t, s+shift, estLen)) #estLen, possibleShift[0]
@@ -99,22 +447,25 @@ class FHSLocator():
         for a given static doppler shift at the beginnig of the transmission 
         """
 
-        estDSidx = bisection(self.DS, staticShift * self.freqPerSlot)
+        if -self.maxDopplerSlots <= staticShift < self.maxDopplerSlots:
+            estDSidx = int(self.staticShiftIdx[staticShift + self.maxDopplerSlots])
+        else:
+            estDSidx = int(self.doppler.index(staticShift * self.freqPerSlot))
 
         fitness = 0
         time = startTime
         for fh, obw in enumerate(seq):
 
-            startFreq = self.baseFreq + obw * self.freqGranularity + round(self.DS[estDSidx] / self.freqPerSlot) -1
+            startFreq = self.baseFreq + obw * self.freqGranularity + int(self.DSslots[estDSidx]) -1
             endFreq = startFreq + self.freqGranularity +1
 
             # header
             if fh < self.numHeaders:
 
                 endTime = time + self.headerSlots
-                header = self.receivedMatrix[startFreq : endFreq, time : endTime]
+                signal = self.index.block_sum('signal', 0, startFreq, endFreq, time, endTime)
 
-                if self.fits(header, True):
+                if signal >= self.headerSize:
                     fitness += 1
                     time = endTime
                     estDSidx -= self.DSperHdr
@@ -125,9 +476,9 @@ class FHSLocator():
             else:
 
                 endTime = time + self.timeGranularity
-                fragment = self.receivedMatrix[startFreq : endFreq, time : endTime]
+                signal = self.index.block_sum('signal', 0, startFreq, endFreq, time, endTime)
 
-                if self.fits(fragment, False):
+                if signal >= self.fragmentSize:
                     fitness += 1
                     time = endTime
                     estDSidx -= self.DSperFrg
@@ -140,26 +491,86 @@ class FHSLocator():
         return True, fitness
     
 
+    def get_template_candidates(self, row: int, startTime: int) -> np.ndarray:
+        """
+        Static shifts (as bank indices) of the bank sequence in the given row whose
+        first hop fits at startTime, all shifts are checked with a single batch lookup
+        """
+
+        startFreq = self.baseFreq + self.bank.freqs[row, :, 0].astype(int)
+        timeOffset, timeLength = self.bank.hopTimes[0]
+        time = startTime + timeOffset
+
+        signal = self.index.count('signal', 0, startFreq, startFreq + self.freqGranularity + 1, time, time + timeLength)
+        minSignal = self.headerSize if self.numHeaders > 0 else self.fragmentSize
+
+        return np.flatnonzero(signal >= minSignal)
+
+
+    def isPossibleTemplate(self, row: int, d: int, startTime: int):
+        """
+        Same as isPossibeShift for the bank sequence in the given row
+        and the static shift d - maxDopplerSlots, hop windows are read from the bank
+        """
+
+        freqs = self.bank.freqs[row, d]
+        hopTimes = self.bank.hopTimes
+
+        fitness = 0
+        for fh in range(self.bank.lengths[row]):
+
+            startFreq = self.baseFreq + int(freqs[fh])
+            endFreq = startFreq + self.freqGranularity +1
+            timeOffset, timeLength = hopTimes[fh]
+            time = startTime + timeOffset
+            signal = self.index.block_sum('signal', 0, startFreq, endFreq, time, time + timeLength)
+
+            # header
+            if fh < self.numHeaders:
+                if signal < self.headerSize:
+                    return False, 0
+
+            # fragment
+            elif signal < self.fragmentSize:
+                if fitness >= self.min_seqlength:
+                    return True, fitness
+
+                return False, 0
+
+            fitness += 1
+
+        return True, fitness
+    
+
     def get_metrics2(self, trueTXs, estTXs):
 
         tp = 0 # tx  in trueTXs &  in estTXs
         fp = 0 # tx !in trueTXs &  in estTXs
         fn = 0 # tx  in trueTXs & !in estTXs
 
+        if isinstance(trueTXs, TransmissionTable):
+            trueTXs = trueTXs.get_triples()
+
         trueTXs_len = [l for t,s,l in trueTXs]
         estTXs_len = [l for t,s,l in estTXs]
 
-        _trueTXs = [[t,s] for t,s,l in trueTXs]
-        _estTXs = [[t,s] for t,s,l in estTXs]
+        _trueTXs = [(t,s) for t,s,l in trueTXs]
+        _estTXs = [(t,s) for t,s,l in estTXs]
+
+        # (t,s) lookups, first estimation of every (t,s) as list.index
+        trueSet = set(_trueTXs)
+        estIndex = {}
+        for j, tx in enumerate(_estTXs):
+            estIndex.setdefault(tx, j)
 
         lenmatch = 0
         minlenerr = 0
         for i, tx in enumerate(_trueTXs):
-            if tx in _estTXs:
+            if tx in estIndex:
                 tp += 1
-                if (estTXs_len[_estTXs.index(tx)] - trueTXs_len[i]) == 0:
+                if (estTXs_len[estIndex[tx]] - trueTXs_len[i]) == 0:
                     lenmatch += 1
-                if estTXs_len[_estTXs.index(tx)] == self.min_seqlength and trueTXs_len[i] != self.min_seqlength:
+                if estTXs_len[estIndex[tx]] == self.min_seqlength and trueTXs_len[i] != self.min_seqlength:
                     minlenerr += 1
                 #print('TP:', t)
             else:
@@ -168,7 +579,7 @@ class FHSLocator():
 
         fplist = []
         for tx in _estTXs:
-            if tx not in _trueTXs:
+            if tx not in trueSet:
                 fp += 1
                 fplist.append(list(tx))
 
@@ -0,0 +1,162 @@
+import numpy as np
+from src.base.base import *
+from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.TransmissionTable import TransmissionTable, get_column
+
+
+def get_hop_times(startSlots: np.ndarray, lengths: np.ndarray, numHeaders,
+                  headerSlots: int, fragmentSlots: int) -> tuple:
+    """
+    Flatten the hops of a set of sequences, returns the sequence index, the position
+    in the sequence and the start and end time slots of every hop. Each hop starts
+    when the previous hop of the same sequence ends.
+    """
+
+    lengths = np.asarray(lengths, dtype=int)
+    seqidx = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    hopidx = np.arange(lengths.sum()) - offsets[seqidx]
+
+    numHeaders = np.broadcast_to(numHeaders, lengths.shape)[seqidx]
+    duration = np.where(hopidx < numHeaders, headerSlots, fragmentSlots)
+
+    endTime = np.cumsum(duration)
+    endTime = endTime - (endTime - duration)[offsets][seqidx] + np.asarray(startSlots)[seqidx]
+    startTime = endTime - duration
+
+    return seqidx, hopidx, startTime, endTime
+
+
+class HopTable():
+    """
+    Columnar geometry of every header/fragment of a transmission set, computed once and
+    read by the matrix builders, the decoders and the dataset generator. Hops are ordered
+    by transmission and then by position in the sequence, the hops of transmission k are
+    the rows offsets[k]:offsets[k+1].
+
+    Args:
+        transmissions (list[LRFHSSTransmission]): transmission set, a TransmissionTable is read column wise.
+        dynamic (bool): dynamic doppler flag, a doppler shift per header/fragment.
+        baseFreq (int): frequency offset to center the transmitter window over the receiver window.
+        freqGranularity (int): number of frequency slots per OBW.
+        timeGranularity (int): number of time slots per fragment.
+        headerSlots (int): number of time slots per header.
+
+    Attributes:
+        txidx, hopidx (np.ndarray): transmission and position in the sequence of every hop.
+        ocw, obw (np.ndarray): OCW channel and OBW of every hop.
+        dopplershift (np.ndarray): rounded doppler shift in frequency slots of every hop.
+        startFreq, endFreq, startTime, endTime (np.ndarray): hop rectangles in the received matrix.
+        offsets (np.ndarray): first hop of every transmission, numTX + 1 entries.
+        lengths, numHeaders (np.ndarray): hops and headers of every transmission.
+
+    Methods:
+        get_geometry(k): (startFreq, endFreq, startTime, endTime) of the hops of transmission k.
+        subset(lo, hi): table of the transmissions lo:hi.
+        retarget(transmissions): table of the same hops with the doppler shifts of other transmissions.
+    """
+
+    def __init__(self, transmissions: list[LRFHSSTransmission], dynamic: bool, baseFreq: int,
+                 freqGranularity: int, timeGranularity: int, headerSlots: int) -> None:
+
+        self.transmissions = transmissions
+        self.dynamic = dynamic
+        self.baseFreq = baseFreq
+        self.freqGranularity = freqGranularity
+
+        columnar = isinstance(transmissions, TransmissionTable)
+
+        if columnar:
+            self.lengths = transmissions.lengths.copy()
+        else:
+            self.lengths = np.array([len(tx.sequence) for tx in transmissions], dtype=int)
+        self.numHeaders = get_column(transmissions, 'numHeaders', int)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths)))
+        startSlots = get_column(transmissions, 'startSlot', int)
+
+        self.txidx, self.hopidx, self.startTime, self.endTime = get_hop_times(startSlots, self.lengths,
+                                                                              self.numHeaders, headerSlots,
+                                                                              timeGranularity)
+
+        if len(transmissions) == 0:
+            self.obw = self.ocw = self.dopplershift = np.zeros(0, dtype=int)
+            self.startFreq = self.endFreq = np.zeros(0, dtype=int)
+            return
+
+        if columnar:
+            self.obw = transmissions.sequences.copy()
+        else:
+            self.obw = np.concatenate([tx.sequence for tx in transmissions]).astype(int)
+        self.ocw = get_column(transmissions, 'ocw', int)[self.txidx]
+        self.set_doppler(transmissions)
+
+
+    def set_doppler(self, transmissions: list[LRFHSSTransmission]) -> None:
+        """
+        Compute the doppler shift and frequency columns from the given transmissions
+        """
+
+        freqPerSlot = OBW_BW / self.freqGranularity
+
+        # variable doppler shift per header / fragment or the first one for all of them
+        if isinstance(transmissions, TransmissionTable):
+            first = transmissions.dopplerOffsets[self.txidx]
+            doppler = transmissions.doppler[first + self.hopidx] if self.dynamic else transmissions.doppler[first]
+        elif self.dynamic:
+            doppler = np.concatenate([tx.dopplerShift[:len(tx.sequence)] for tx in transmissions])
+        else:
+            doppler = np.array([tx.dopplerShift[0] for tx in transmissions])[self.txidx]
+        self.dopplershift = np.round(np.asarray(doppler) / freqPerSlot).astype(int)
+
+        self.startFreq = self.baseFreq + self.obw * self.freqGranularity + self.dopplershift
+        self.endFreq = self.startFreq + self.freqGranularity
+
+
+    def __len__(self) -> int:
+        return len(self.txidx)
+
+
+    def get_geometry(self, k: int) -> tuple:
+        """
+        Return (startFreq, endFreq, startTime, endTime) arrays for the hops of transmission k
+        """
+        h0, h1 = self.offsets[k], self.offsets[k+1]
+        return self.startFreq[h0:h1], self.endFreq[h0:h1], self.startTime[h0:h1], self.endTime[h0:h1]
+
+
+    def subset(self, lo: int, hi: int) -> 'HopTable':
+        """
+        Return the table of transmissions lo:hi, columns are views of this table
+        """
+
+        h0, h1 = self.offsets[lo], self.offsets[hi]
+
+        table = HopTable.__new__(HopTable)
+        table.transmissions = self.transmissions[lo:hi]
+        table.dynamic = self.dynamic
+        table.baseFreq = self.baseFreq
+        table.freqGranularity = self.freqGranularity
+        table.lengths = self.lengths[lo:hi]
+        table.numHeaders = self.numHeaders[lo:hi]
+        table.offsets = self.offsets[lo:hi+1] - h0
+        table.txidx = self.txidx[h0:h1] - lo
+
+        for column in ('hopidx', 'obw', 'ocw', 'dopplershift', 'startFreq', 'endFreq', 'startTime', 'endTime'):
+            setattr(table, column, getattr(self, column)[h0:h1])
+
+        return table
+
+
+    def retarget(self, transmissions: list[LRFHSSTransmission]) -> 'HopTable':
+        """
+        Return the table of the same traffic as seen by another receiver, transmissions
+        must match this table one to one and only differ in their doppler shifts. Time,
+        OBW and OCW columns are shared, only the frequency columns are recomputed
+        """
+
+        table = self.subset(0, len(self.transmissions))
+        table.transmissions = transmissions
+        if len(transmissions):
+            table.set_doppler(transmissions)
+
+        return table
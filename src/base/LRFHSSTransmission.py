@@ -19,6 +19,9 @@ class LRFHSSTransmission():
         power (float): transmission power
     """
 
+    __slots__ = ('id', 'node_id', 'startSlot', 'ocw', 'numHeaders', 'payload_size', 'numFragments',
+                 'sequence', 'seqid', 'distance', 'dopplerShift', 'power')
+
     def __init__(self, id: int, node_id: int, startSlot: int, ocw: int, numHeaders: int,
                  payload_size: int, numFragments: int, sequence: list[int], seqid: int,
                  distance: float, dopplerShift: list[float], power: float) -> None:
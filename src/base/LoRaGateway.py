@@ -1,5 +1,12 @@
 import numpy as np
 from src.base.Processor import Processor
+from src.base.DecoderPool import DecoderPool
+from src.base.BlockIndex import BlockIndex
+from src.base.DtypePolicy import DtypePolicy
+from src.base.WindowedRcvM import WindowedRcvM
+from src.base.OverlapRcvM import OverlapRcvM
+from src.base.DecoderScheduler import DecoderScheduler
+from src.base.HopTable import HopTable
 from src.base.LRFHSSTransmission import LRFHSSTransmission
 
 class LoRaGateway():
@@ -15,9 +22,13 @@ class LoRaGateway():
         use_earlydecode (bool): early decode mechanism flag.
         use_headerdrop (bool): header drop mechanism flag.
         numDecoders (int): number of decoders/processors in the gateway.
+        baseFreq (int): frequency offset to center the transmitter window over the receiver window.
+        collision_method (str): collision determination method, "strict" / "SINR".
+        dtypes (DtypePolicy): data types of the received matrices.
+        scheduler (str): decoder assignment policy, "firstfit" / "leastloaded" / "random".
 
     Attributes:
-        _processors (list[Processor]): A list of processors that handle decoding of LoRa transmissions.
+        _decoders (DecoderPool): state of the decoders that handle decoding of LoRa transmissions.
 
     Methods:
         restart(): Reset all processors to initial state.
@@ -25,136 +36,169 @@ class LoRaGateway():
         get_collided_packets(): Return total collided packets.
         get_decoded_packets(): Return total successfully decoded packets.
         get_decoded_bytes(): Return total successfully decoded bytes.
-        run(list[AbstractEvent]): Decode given list of transmissions.
+        run(list[AbstractEvent]): Decode given list of transmissions, returns the decoders free up times.
     """
 
     def __init__(self, CR: int, timeGranularity: int, freqGranularity: int, use_earlydrop: bool, 
-                 use_earlydecode: bool, use_headerdrop: bool, numDecoders: int, baseFreq: int, collision_method: str) -> None:
+                 use_earlydecode: bool, use_headerdrop: bool, numDecoders: int, baseFreq: int, collision_method: str,
+                 dtypes: DtypePolicy = DtypePolicy(), scheduler: str = "firstfit") -> None:
         self.numDecoders = numDecoders
-        self._processors = [Processor(CR, timeGranularity, freqGranularity, use_earlydrop, use_earlydecode,
-                                      use_headerdrop, baseFreq, collision_method) for _ in range(numDecoders)]
+        self.collision_method = collision_method
+        self.scheduler = scheduler
+        self._decoders = DecoderPool(numDecoders, Processor(CR, timeGranularity, freqGranularity, use_earlydrop,
+                                                            use_earlydecode, use_headerdrop, baseFreq,
+                                                            collision_method, dtypes))
     
 
     def restart(self) -> None:
         """
-        Reset all processor to initial state
+        Reset all decoders to initial state
         """
-        processor : Processor
-        for processor in self._processors:
-            processor.reset()
+        self._decoders.reset()
 
     def get_decoded_headers(self) -> list[LRFHSSTransmission]:
         """
-        Return decoded headers
+        Return decoded headers, grouped by decoder in decoder order
         """
-        decoded = []
-        for processor in self._processors:
-            decoded += processor.decoded_headers
-        return decoded
+        order = np.argsort(self._decoders.headers_by, kind='stable')
+        return [self._decoders.decoded_headers[k] for k in order]
         
     def get_decoded(self) -> list:
         """
-        Return decoded transmissions, 1 means decoded payload
+        Return decoded transmissions, 1 means decoded payload, grouped by decoder in decoder order
         """
-        decoded = []
-        for processor in self._processors:
-            for tx_status in processor.decoded:
-                decoded.append(tx_status)
-        return decoded
+        order = np.argsort(self._decoders.decoded_by, kind='stable')
+        return [self._decoders.decoded[k] for k in order]
+
+    def get_outcomes(self) -> list:
+        """
+        Return [tx, outcome] of every tracked transmission, outcomes as in Processor
+        """
+        return list(self._decoders.outcomes)
 
     def get_tracked_txs(self) -> int:
         """
         Return total tracked frames by the gateway
         """
-        tracked_txs = 0
-        processor : Processor
-        for processor in self._processors:
-            tracked_txs += processor.tracked_txs
-        return tracked_txs
+        return self._decoders.get_total('tracked_txs')
     
     def get_decoded_bytes(self) -> int:
         """
         Return total successfully decoded bytes
         """
-        decoded_bytes = 0
-        processor : Processor
-        for processor in self._processors:
-            decoded_bytes += processor.decoded_bytes
-        return decoded_bytes
+        return self._decoders.get_total('decoded_bytes')
     
     def get_header_drop_packets(self) -> int:
         """
         Return packets dropped due to no header decoding
         """
-        header_drop_packets = 0
-        processor : Processor
-        for processor in self._processors:
-            header_drop_packets += processor.header_drop_packets
-        return header_drop_packets
+        return self._decoders.get_total('header_drop_packets')
     
     def get_decoded_hrd_pld(self) -> int:
         """
         Return total fully decoded packets
         """
-        decoded_hrd_pld = 0
-        processor : Processor
-        for processor in self._processors:
-            decoded_hrd_pld += processor.decoded_hrd_pld
-        return decoded_hrd_pld
+        return self._decoders.get_total('decoded_hrd_pld')
 
     def get_decoded_hdr(self) -> int:
         """
         Return total decoded headers with collided payload
         """
-        decoded_hdr = 0
-        processor : Processor
-        for processor in self._processors:
-            decoded_hdr += processor.decoded_hdr
-
-        return decoded_hdr
+        return self._decoders.get_total('decoded_hdr')
     
     def get_decodable_pld(self) -> int:
         """
         Return total decodable payloads with collided header
         """
-        decodable_pld = 0
-        processor : Processor
-        for processor in self._processors:
-            decodable_pld += processor.decodable_pld
-        return decodable_pld
+        return self._decoders.get_total('decodable_pld')
     
     def get_collided_hdr_pld(self) -> int:
         """
         Return total fully collided packets
         """
-        collided_hdr_pld = 0
-        processor : Processor
-        for processor in self._processors:
-            collided_hdr_pld += processor.collided_hdr_pld
-        return collided_hdr_pld
+        return self._decoders.get_total('collided_hdr_pld')
     
 
-    def predecode(self, transmissions: list[LRFHSSTransmission], 
-                  rcvM: np.ndarray, dynamic: bool) -> None:
+    def get_block_index(self, rcvM: np.ndarray) -> BlockIndex:
+        """
+        Return a block index over the dense received matrix for strict collision
+        queries, matrix free received matrices answer them directly. None for other
+        collision methods and matrix backends
+        """
+        if self.collision_method == 'strict' and isinstance(rcvM, np.ndarray):
+            return BlockIndex(rcvM)
+        if self.collision_method == 'strict' and isinstance(rcvM, WindowedRcvM):
+            return BlockIndex(rcvM.matrix, timeOffset=rcvM.timeOffset)
+        if self.collision_method == 'strict' and isinstance(rcvM, OverlapRcvM):
+            return rcvM
+        return None
+
+
+    def get_hop_table(self, transmissions: list[LRFHSSTransmission], dynamic: bool,
+                      table: HopTable = None) -> HopTable:
+        """
+        Return the given per hop geometry table or build it for transmissions
+        """
+        if table is None:
+            table = self._decoders.processor.get_hop_table(transmissions, dynamic)
+        return table
+
+
+    def predecode(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray, dynamic: bool,
+                  freeUpTimes: np.ndarray = None, table: HopTable = None) -> np.ndarray:
+
+        index = self.get_block_index(rcvM)
+        table = self.get_hop_table(transmissions, dynamic, table)
+
+        scheduler = DecoderScheduler(self.numDecoders, self.scheduler, freeUpTimes)
+        for k, tx in enumerate(transmissions):
+
+            i = scheduler.acquire(tx.startSlot)
+            if i is not None:
+                fut = self._decoders.predecode_headers(i, tx, rcvM, dynamic, index, table.get_geometry(k))
+                scheduler.release(i, fut)
+
+        return scheduler.freeUpTimes
+
+
+    def run(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray, dynamic: bool,
+            freeUpTimes: np.ndarray = None, table: HopTable = None) -> np.ndarray:
+        """
+        Decode transmissions in order, each one on a free decoder chosen by the scheduler
+        policy. The free up times of a previous call can be given to continue decoding a
+        later part of the same set. With the SINR method, or the strict method on a dense
+        matrix, the outcomes of all transmissions are computed in a single batch before the
+        assignment. The hop geometry is read from table when given
+        """
+
+        index = self.get_block_index(rcvM)
+        table = self.get_hop_table(transmissions, dynamic, table)
+
+        scheduler = DecoderScheduler(self.numDecoders, self.scheduler, freeUpTimes)
+
+        batch = index is not None or self.collision_method == 'SINR'
+        if batch and self.numDecoders:
+            processor = self._decoders.processor
+            outcomes, txFreeUpTimes = processor.get_batch_outcomes(transmissions, rcvM, dynamic, index, table)
+
+            # decoder of every transmission, -1 if all of them are busy
+            decoders = np.full(len(transmissions), -1)
+            for k, (tx, fut) in enumerate(zip(transmissions, txFreeUpTimes)):
 
-        freeUpTimes = np.zeros(self.numDecoders)
-        for tx in transmissions:
-            for i, fut in enumerate(freeUpTimes):
+                i = scheduler.acquire(tx.startSlot)
+                if i is not None:
+                    decoders[k] = i
+                    scheduler.release(i, None if np.isnan(fut) else fut)
 
-                if tx.startSlot >= fut:
-                    processor = self._processors[i]
-                    freeUpTimes[i] = processor.predecode_headers(tx, rcvM, dynamic)
-                    break
+            assigned = np.flatnonzero(decoders >= 0)
+            self._decoders.commit_batch(decoders[assigned], [transmissions[k] for k in assigned], outcomes[assigned])
 
+            return scheduler.freeUpTimes
 
-    def run(self, transmissions: list[LRFHSSTransmission],
-            rcvM: np.ndarray, dynamic: bool) -> None:
+        for k, tx in enumerate(transmissions):
 
-        freeUpTimes = np.zeros(self.numDecoders)
-        for tx in transmissions:
-            for i, fut in enumerate(freeUpTimes):
+            i = scheduler.acquire(tx.startSlot)
+            if i is not None:
+                scheduler.release(i, self._decoders.decode(i, tx, rcvM, dynamic, index, table.get_geometry(k)))
 
-                if tx.startSlot >= fut:
-                    processor = self._processors[i]
-                    freeUpTimes[i] = processor.decode(tx, rcvM, dynamic)
-                    break
+        return scheduler.freeUpTimes
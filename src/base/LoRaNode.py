@@ -2,6 +2,7 @@ import random
 import numpy as np
 from src.base.base import *
 from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.DopplerModel import get_doppler_model
 from src.families.LR_FHSS_DriverMethod import FHSfamily
 
 class LoRaNode():
@@ -39,6 +40,7 @@ class LoRaNode():
         self.sent_payload_bytes = 0
         self.TXpower_dB = TX_PWR_DB
         self.maxFrameT = MAX_FRM_TM
+        self.doppler = get_doppler_model()
 
 
     def restart(self) -> None:
@@ -107,12 +109,12 @@ class LoRaNode():
         self.sent_payload_bytes += payload_size
 
         dis2sat = random.uniform(SAT_H, SAT_RANGE)
-        tau = get_visibility_time(dis2sat)
+        tau = self.doppler.visibility_time(dis2sat)
         
         time = random.uniform(-tau+self.maxFrameT, tau-self.maxFrameT)
 
         hdr_frg_times = self.calculate_hdr_frg_times(time, numHeaders, numFragments)
-        dynamicDoppler = [dopplerShift(t) for t in hdr_frg_times]
+        dynamicDoppler = self.doppler.shift(hdr_frg_times).tolist()
         #staticDoppler = [0 for t in hdr_frg_times]
 
         tx = LRFHSSTransmission(self.id, self.id, startSlot, ocw, numHeaders, payload_size, numFragments,
@@ -0,0 +1,120 @@
+import numpy as np
+from src.base.base import *
+from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.DtypePolicy import DtypePolicy
+from src.base.HopTable import HopTable, get_hop_times
+from src.base.TransmissionTable import get_column
+
+
+def scatter_blocks(shape: tuple, ocw: np.ndarray, f0: np.ndarray, f1: np.ndarray,
+                   t0: np.ndarray, t1: np.ndarray, values, dtype=float) -> np.ndarray:
+    """
+    Accumulate the (ocw, f0:f1, t0:t1) blocks into a new (numOCW, F, T) matrix.
+    Each block adds its value at the four corners of a 2-D difference array,
+    then a cumulative sum over frequency and time recovers the matrix.
+    Block limits are clipped to the matrix shape. Unsigned counts are accumulated
+    in a wider type and saturate at the maximum value of dtype.
+    """
+
+    numOCW, F, T = shape
+
+    f0 = np.clip(f0, 0, F)
+    f1 = np.clip(f1, 0, F)
+    t0 = np.clip(t0, 0, T)
+    t1 = np.clip(t1, 0, T)
+    accumulator = DtypePolicy.accumulator(dtype)
+    values = np.broadcast_to(np.asarray(values, dtype=accumulator), np.shape(ocw))
+
+    diff = np.zeros((numOCW, F + 1, T + 1), dtype=accumulator)
+    np.add.at(diff, (ocw, f0, t0), values)
+    np.add.at(diff, (ocw, f0, t1), -values)
+    np.add.at(diff, (ocw, f1, t0), -values)
+    np.add.at(diff, (ocw, f1, t1), values)
+
+    np.cumsum(diff, axis=1, out=diff)
+    np.cumsum(diff, axis=2, out=diff)
+
+    return DtypePolicy.saturate(diff[:, :F, :T], dtype)
+
+
+class MatrixBuilder():
+    """
+    Vectorized received matrix builder shared by the network models and the dataset generator.
+
+    Args:
+        numOCW (int): number of OCW channels.
+        frequencySlots (int): frequency slots per OCW channel.
+        simTime (int): simulation time in time slots.
+        baseFreq (int): frequency offset to center the transmitter window over the receiver window.
+        freqGranularity (int): number of frequency slots per OBW.
+        timeGranularity (int): number of time slots per fragment.
+        headerSlots (int): number of time slots per header.
+        dtypes (DtypePolicy): data types of count and power matrices.
+
+    Methods:
+        get_hop_table(transmissions, dynamic): per hop geometry table.
+        get_hops(transmissions, power, dynamic, table): per hop geometry and power as arrays.
+        build(hops, dtype): accumulate the given hops into a received matrix.
+        get_rcvM(transmissions, power, dynamic, table): received matrix of the given transmissions.
+    """
+
+    def __init__(self, numOCW: int, frequencySlots: int, simTime: int, baseFreq: int,
+                 freqGranularity: int, timeGranularity: int, headerSlots: int,
+                 dtypes: DtypePolicy = DtypePolicy()) -> None:
+        self.numOCW = numOCW
+        self.frequencySlots = frequencySlots
+        self.simTime = simTime
+        self.baseFreq = baseFreq
+        self.freqGranularity = freqGranularity
+        self.timeGranularity = timeGranularity
+        self.headerSlots = headerSlots
+        self.freqPerSlot = OBW_BW / freqGranularity
+        self.dtypes = dtypes
+
+
+    def get_hop_table(self, transmissions: list[LRFHSSTransmission], dynamic: bool) -> HopTable:
+        """
+        Per hop geometry of the given transmissions
+        """
+        return HopTable(transmissions, dynamic, self.baseFreq, self.freqGranularity,
+                        self.timeGranularity, self.headerSlots)
+
+
+    def get_hops(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool,
+                 table: HopTable = None) -> tuple:
+        """
+        Compute (ocw, startFreq, endFreq, startTime, endTime, RXpower) for every
+        header/fragment of the given transmissions in a single pass, the geometry
+        is read from table when given. Hops are ordered by transmission and then
+        by position in the sequence.
+        """
+
+        if table is None:
+            table = self.get_hop_table(transmissions, dynamic)
+
+        RXpower = np.ones(len(table))
+        if power and len(table):
+            distance = get_column(transmissions, 'distance')[table.txidx]
+            TXpower = get_column(transmissions, 'power')[table.txidx]
+            carrier = OCW_FC + table.startFreq * self.freqPerSlot
+            RXpower = dBm2mW(GAIN_TX) * dBm2mW(GAIN_RX) * dBm2mW(TXpower) \
+                    * get_FS_pathloss(distance, carrier)
+
+        return table.ocw, table.startFreq, table.endFreq, table.startTime, table.endTime, RXpower
+
+
+    def build(self, hops: tuple, dtype=float) -> np.ndarray:
+        """
+        Accumulate the given hops into a (numOCW, frequencySlots, simTime) matrix
+        """
+        shape = (self.numOCW, self.frequencySlots, self.simTime)
+        return scatter_blocks(shape, *hops, dtype=dtype)
+
+
+    def get_rcvM(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool,
+                 table: HopTable = None) -> np.ndarray:
+        """
+        Received matrix of the given transmissions, without noise
+        """
+        dtype = self.dtypes.power if power else self.dtypes.count
+        return self.build(self.get_hops(transmissions, power, dynamic, table), dtype)
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from src.base.SparseRcvM import OCWView
+
+
+class MemmapRcvM():
+    """
+    Received matrix backed by a memory mapped file in a scratch directory.
+    The matrix is split in chunks of chunkTime time slots, each chunk is stored
+    contiguously as (numOCW, frequencySlots, chunkTime), so decoders and the
+    FHS locator moving forward in time read the file sequentially.
+
+    Args:
+        shape (tuple[int]): shape of the equivalent dense matrix (numOCW, frequencySlots, simTime)
+        dtype (np.dtype): data type of the matrix.
+        chunkTime (int): time slots per chunk.
+        scratch_dir (str): directory for the backing file, a temporary directory if None.
+
+    Attributes:
+        shape (tuple[int]): shape of the equivalent dense matrix.
+        ndim (int): number of dimensions of the equivalent dense matrix.
+        path (str): backing file path.
+
+    Methods:
+        get_chunk(k): writable (numOCW, frequencySlots, chunkTime) view of chunk k.
+        get_chunk_limits(k): first and last (excluded) time slot of chunk k.
+        get_block(ocw, f0, f1, t0, t1): dense block for the given coordinates.
+        toarray(): dense equivalent matrix.
+        flush(): write pending changes to disk.
+        close(): release the memory map and delete the backing file.
+    """
+
+    def __init__(self, shape: tuple, dtype, chunkTime: int, scratch_dir: str = None) -> None:
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(dtype)
+        self.chunkTime = chunkTime
+
+        numOCW, F, T = self.shape
+        self.numChunks = -(-T // chunkTime)
+
+        self._tmpdir = None
+        if scratch_dir is None:
+            scratch_dir = self._tmpdir = tempfile.mkdtemp(prefix='rcvM-')
+
+        fd, self.path = tempfile.mkstemp(suffix='.dat', dir=scratch_dir)
+        os.close(fd)
+
+        self._mm = np.memmap(self.path, dtype=self.dtype, mode='w+',
+                             shape=(self.numChunks, numOCW, F, chunkTime))
+
+
+    def get_chunk(self, k: int) -> np.memmap:
+        return self._mm[k]
+
+
+    def get_chunk_limits(self, k: int) -> tuple:
+        return k * self.chunkTime, min((k + 1) * self.chunkTime, self.shape[2])
+
+
+    def get_block(self, ocw: int, f0: int, f1: int, t0: int, t1: int) -> np.ndarray:
+        """
+        Return the dense (f0:f1, t0:t1) block of OCW channel ocw,
+        limits must be already clipped to the matrix shape
+        """
+
+        if t1 <= t0 or f1 <= f0:
+            return np.zeros((max(f1 - f0, 0), max(t1 - t0, 0)), dtype=self.dtype)
+
+        k0 = t0 // self.chunkTime
+        k1 = (t1 - 1) // self.chunkTime
+
+        # most blocks are inside a single chunk
+        if k0 == k1:
+            c0 = k0 * self.chunkTime
+            return np.array(self._mm[k0, ocw, f0:f1, t0 - c0 : t1 - c0])
+
+        parts = []
+        for k in range(k0, k1 + 1):
+            c0, c1 = self.get_chunk_limits(k)
+            parts.append(self._mm[k, ocw, f0:f1, max(t0, c0) - c0 : min(t1, c1) - c0])
+
+        return np.concatenate(parts, axis=1)
+
+
+    def toarray(self) -> np.ndarray:
+        """
+        Return dense equivalent matrix
+        """
+        _, F, T = self.shape
+        return np.stack([self.get_block(ocw, 0, F, 0, T) for ocw in range(self.shape[0])])
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            return OCWView(self, key)
+
+        ocw, fslice, tslice = key
+        _, F, T = self.shape
+        f0, f1, _ = fslice.indices(F)
+        t0, t1, _ = tslice.indices(T)
+
+        return self.get_block(ocw, f0, f1, t0, t1)
+
+
+    def flush(self) -> None:
+        if self._mm is not None:
+            self._mm.flush()
+
+
+    def close(self) -> None:
+        """
+        Release the memory map and delete the backing file, the matrix can not be used afterwards
+        """
+
+        if self._mm is None:
+            return
+
+        # the map is released once no chunk views are alive
+        self._mm = None
+
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+    def __del__(self) -> None:
+        if getattr(self, '_mm', None) is not None:
+            self.close()
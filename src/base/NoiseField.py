@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    """
+    SplitMix64 finalizer over uint64 counters, a stateless hash with
+    uniformly distributed outputs used as a counter based RNG
+    """
+
+    x = np.asarray(x, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        z = x + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class NoiseField():
+    """
+    Rayleigh noise over a (numOCW, frequencySlots, simTime) matrix generated on demand.
+    The noise of slot (ocw, f, t) only depends on the seed and its coordinates, so any
+    block can be drawn without generating the rest of the matrix and drawing the same
+    block twice gives the same values.
+
+    Args:
+        shape (tuple[int]): shape of the noise matrix (numOCW, frequencySlots, simTime).
+        scale (float): scale of the unit rayleigh samples.
+        seed (int): noise realization, a new seed resamples the whole matrix.
+        dtype (np.dtype): data type of the returned blocks.
+        firstOCW (int): OCW channel of the full matrix at index 0, see get_channel.
+
+    Methods:
+        get_block(ocw, f0, f1, t0, t1): noise of the (f0:f1, t0:t1) block of OCW channel ocw.
+        get_blocks(ocw, f0, t0, numFreq, numTime): noise of a batch of equally sized blocks.
+        get_channel(ocw): noise of one OCW channel as a single channel field.
+    """
+
+    def __init__(self, shape: tuple, scale: float, seed: int, dtype=np.float64, firstOCW: int = 0) -> None:
+        self.shape = tuple(shape)
+        self.scale = scale
+        self.seed = seed
+        self.dtype = np.dtype(dtype)
+        self.firstOCW = firstOCW
+        self._key = splitmix64(np.uint64(seed % 2**64))
+
+
+    def get_block(self, ocw: int, f0: int, f1: int, t0: int, t1: int) -> np.ndarray:
+        """
+        Return the noise of the (f0:f1, t0:t1) block of OCW channel ocw,
+        limits must be already clipped to the matrix shape
+        """
+
+        _, F, T = self.shape
+        f = np.arange(f0, max(f1, f0), dtype=np.uint64)
+        t = np.arange(t0, max(t1, t0), dtype=np.uint64)
+        counter = (np.uint64((self.firstOCW + ocw) * F) + f[:, np.newaxis]) * np.uint64(T) + t[np.newaxis, :]
+
+        return self.sample(counter)
+
+
+    def get_blocks(self, ocw, f0, t0, numFreq: int, numTime: int) -> np.ndarray:
+        """
+        Return the noise of the (f0:f0+numFreq, t0:t0+numTime) blocks of a batch of
+        hops as a (numBlocks, numFreq, numTime) array, slots outside the matrix are zero
+        """
+
+        _, F, T = self.shape
+        ocw, f0, t0 = (np.atleast_1d(a) for a in np.broadcast_arrays(ocw, f0, t0))
+
+        f = f0[:, np.newaxis, np.newaxis] + np.arange(numFreq)[np.newaxis, :, np.newaxis]
+        t = t0[:, np.newaxis, np.newaxis] + np.arange(numTime)[np.newaxis, np.newaxis, :]
+        inside = (f >= 0) & (f < F) & (t >= 0) & (t < T)
+
+        ocw = self.firstOCW + ocw[:, np.newaxis, np.newaxis]
+        counter = (ocw * F + np.clip(f, 0, F - 1)) * T + np.clip(t, 0, T - 1)
+
+        return np.where(inside, self.sample(counter.astype(np.uint64)), 0).astype(self.dtype)
+
+
+    def get_channel(self, ocw: int) -> 'NoiseField':
+        """
+        Return the noise of OCW channel ocw as a (1, frequencySlots, simTime) field,
+        channel 0 of the returned field has the same values as channel ocw of this one
+        """
+        _, F, T = self.shape
+        return NoiseField((1, F, T), self.scale, self.seed, self.dtype, self.firstOCW + ocw)
+
+
+    def sample(self, counter: np.ndarray) -> np.ndarray:
+        """
+        Noise of the given slot counters
+        """
+
+        # top 53 bits as a uniform sample in [0, 1), inverse rayleigh CDF
+        u = (splitmix64(counter ^ self._key) >> np.uint64(11)) * 2.0**-53
+        return (np.sqrt(-2 * np.log1p(-u)) * self.scale).astype(self.dtype)
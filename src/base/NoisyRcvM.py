@@ -0,0 +1,72 @@
+import numpy as np
+from src.base.NoiseField import NoiseField
+from src.base.SparseRcvM import OCWView
+
+
+class NoisyRcvM():
+    """
+    Power based received matrix kept as two layers, the signal matrix of the transmissions
+    and a lazy noise field. Noise is only generated for the blocks read by the decoders,
+    and the noise can be resampled without recomputing the signal matrix.
+
+    Args:
+        signal (np.ndarray): (numOCW, frequencySlots, simTime) received power without noise.
+        noise (NoiseField): noise layer with the same shape.
+
+    Attributes:
+        signal (np.ndarray): signal layer.
+        noise (NoiseField): noise layer.
+
+    Methods:
+        get_block(ocw, f0, f1, t0, t1): signal plus noise of the given block.
+        resample(seed): same signal layer with a new noise realization.
+        toarray(): dense equivalent matrix.
+    """
+
+    def __init__(self, signal: np.ndarray, noise: NoiseField) -> None:
+        self.signal = signal
+        self.noise = noise
+        self.shape = signal.shape
+        self.ndim = signal.ndim
+        self.dtype = signal.dtype
+
+
+    def get_block(self, ocw: int, f0: int, f1: int, t0: int, t1: int) -> np.ndarray:
+        """
+        Return the (f0:f1, t0:t1) block of OCW channel ocw,
+        limits must be already clipped to the matrix shape
+        """
+        return self.signal[ocw, f0 : f1, t0 : t1] + self.noise.get_block(ocw, f0, f1, t0, t1)
+
+
+    def resample(self, seed: int) -> 'NoisyRcvM':
+        """
+        Return a received matrix sharing the signal layer with a new noise seed
+        """
+        noise = NoiseField(self.noise.shape, self.noise.scale, seed, self.noise.dtype, self.noise.firstOCW)
+        return NoisyRcvM(self.signal, noise)
+
+
+    def toarray(self) -> np.ndarray:
+        """
+        Return dense equivalent matrix
+        """
+        _, F, T = self.shape
+        return np.stack([self.get_block(ocw, 0, F, 0, T) for ocw in range(self.shape[0])])
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            return OCWView(self, key)
+
+        ocw, fslice, tslice = key
+        _, F, T = self.shape
+        f0, f1, _ = fslice.indices(F)
+        t0, t1, _ = tslice.indices(T)
+
+        return self.get_block(ocw, f0, f1, t0, t1)
@@ -0,0 +1,195 @@
+import numpy as np
+from src.base.NoiseField import NoiseField
+from src.base.BlockIndex import normalize_slices
+from src.base.SparseRcvM import OCWView
+
+
+class OverlapRcvM():
+    """
+    Matrix free received matrix. The header/fragment rectangles are kept sorted by
+    OCW channel and start time, the rectangles overlapping a batch of queries are found
+    with a sweep over time followed by a frequency overlap check. Collision status and
+    per slot counts or power are computed from the overlapping pairs only, so the cost
+    scales with the number of hops and overlaps instead of frequencySlots x simTime.
+
+    Args:
+        shape (tuple[int]): shape of the equivalent dense matrix (numOCW, frequencySlots, simTime)
+        hops (tuple[np.ndarray]): (ocw, f0, f1, t0, t1, value) rectangles, as returned by MatrixBuilder.get_hops
+        noise (NoiseField): noise layer added to the queried blocks, None for count matrices.
+        dtype (np.dtype): data type of the returned blocks.
+
+    Attributes:
+        shape (tuple[int]): shape of the equivalent dense matrix.
+        ndim (int): number of dimensions of the equivalent dense matrix.
+        noise (NoiseField): noise layer.
+
+    Methods:
+        get_overlaps(ocw, f0, f1, t0, t1): (query, rectangle) pairs with a non empty intersection.
+        isCollided(ocw, f0, f1, t0, t1): strict collision status of a batch of blocks.
+        get_blocks(ocw, f0, t0, numFreq, numTime): dense batch of equally sized blocks.
+        get_block(ocw, f0, f1, t0, t1): dense block for the given coordinates.
+        toarray(): dense equivalent matrix.
+    """
+
+    def __init__(self, shape: tuple, hops: tuple, noise: NoiseField = None, dtype=np.float64) -> None:
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.noise = noise
+        self.dtype = np.dtype(dtype)
+
+        _, F, T = self.shape
+        ocw, f0, f1, t0, t1, values = hops
+
+        # rectangles are clipped to the matrix as in scatter_blocks
+        ocw = np.asarray(ocw, dtype=int)
+        f0, f1 = np.clip(f0, 0, F), np.clip(f1, 0, F)
+        t0, t1 = np.clip(t0, 0, T), np.clip(t1, 0, T)
+        values = np.broadcast_to(np.asarray(values, dtype=float), ocw.shape)
+
+        # sweep order, OCW channel first and start time second, empty rectangles are dropped
+        key = ocw * (T + 1) + t0
+        order = np.argsort(key, kind='stable')
+        order = order[(f1[order] > f0[order]) & (t1[order] > t0[order])]
+
+        self._key = key[order]
+        self._ocw, self._f0, self._f1 = ocw[order], f0[order], f1[order]
+        self._t0, self._t1, self._values = t0[order], t1[order], values[order]
+        self._maxDuration = int((self._t1 - self._t0).max()) if len(order) else 0
+
+
+    def get_overlaps(self, ocw, f0, f1, t0, t1) -> tuple:
+        """
+        Return the (query, rectangle) index pairs of a batch of already clipped queries
+        whose intersection is not empty, rectangles are indexed in sweep order
+        """
+
+        _, _, T = self.shape
+        ocw, f0, f1, t0, t1 = np.broadcast_arrays(ocw, f0, f1, t0, t1)
+
+        # only rectangles starting in ]t0 - maxDuration, t1[ of the same channel can reach a query
+        qkey = ocw * (T + 1)
+        lo = np.searchsorted(self._key, qkey + t0 - self._maxDuration, side='right')
+        hi = np.searchsorted(self._key, qkey + t1, side='left')
+
+        # empty queries have no overlaps
+        counts = np.where((f1 > f0) & (t1 > t0), np.maximum(hi - lo, 0), 0)
+        query = np.repeat(np.arange(len(ocw)), counts)
+        rect = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+
+        overlap = (self._ocw[rect] == ocw[query]) \
+                & (self._t1[rect] > t0[query]) & (self._t0[rect] < t1[query]) \
+                & (self._f1[rect] > f0[query]) & (self._f0[rect] < f1[query])
+
+        return query[overlap], rect[overlap]
+
+
+    def isCollided(self, ocw, f0, f1, t0, t1) -> np.ndarray:
+        """
+        Strict collision status of a batch of blocks of a count based matrix, a block is
+        collided if any of its slots is not exactly 1, python slicing rules apply to every block.
+        A block fully covered by a single rectangle only depends on its value and any other
+        rectangle reaching it makes a slot greater than 1, the per slot counts are only
+        computed for blocks covered by several partial rectangles
+        """
+
+        _, F, T = self.shape
+        ocw, f0, f1, t0, t1 = np.broadcast_arrays(ocw, f0, f1, t0, t1)
+        f0, f1 = normalize_slices(f0, f1, F)
+        t0, t1 = normalize_slices(t0, t1, T)
+        area = (f1 - f0) * (t1 - t0)
+
+        query, rect = self.get_overlaps(ocw, f0, f1, t0, t1)
+        covered = (np.minimum(self._f1[rect], f1[query]) - np.maximum(self._f0[rect], f0[query])) \
+                * (np.minimum(self._t1[rect], t1[query]) - np.maximum(self._t0[rect], t0[query]))
+
+        numOverlaps = np.bincount(query, minlength=len(ocw))
+        full = np.zeros(len(ocw), dtype=bool)
+        full[query[covered == area[query]]] = True
+
+        # empty blocks are never collided, uncovered slots always are
+        collided = area > 0
+
+        single = full & (numOverlaps == 1)
+        singleValue = np.zeros(len(ocw))
+        singleValue[query] = self._values[rect]
+        collided[single] = singleValue[single] != 1
+
+        for q in np.flatnonzero(~full & (numOverlaps > 1)):
+            block = self.get_signal_blocks(ocw[q], f0[q], t0[q], f1[q] - f0[q], t1[q] - t0[q])[0]
+            collided[q] = not (block == 1).all()
+
+        return collided
+
+
+    def get_signal_blocks(self, ocw, f0, t0, numFreq: int, numTime: int) -> np.ndarray:
+        """
+        Signal of the (f0:f0+numFreq, t0:t0+numTime) blocks without noise, shape (numBlocks, numFreq, numTime).
+        Every overlapping rectangle adds its value at the four corners of a per block difference array
+        """
+
+        ocw, f0, t0 = (np.atleast_1d(a) for a in np.broadcast_arrays(ocw, f0, t0))
+        query, rect = self.get_overlaps(ocw, f0, f0 + numFreq, t0, t0 + numTime)
+
+        # intersection limits relative to the block
+        rf0 = np.maximum(self._f0[rect], f0[query]) - f0[query]
+        rf1 = np.minimum(self._f1[rect], f0[query] + numFreq) - f0[query]
+        rt0 = np.maximum(self._t0[rect], t0[query]) - t0[query]
+        rt1 = np.minimum(self._t1[rect], t0[query] + numTime) - t0[query]
+        values = self._values[rect]
+
+        diff = np.zeros((len(ocw), numFreq + 1, numTime + 1))
+        np.add.at(diff, (query, rf0, rt0), values)
+        np.add.at(diff, (query, rf0, rt1), -values)
+        np.add.at(diff, (query, rf1, rt0), -values)
+        np.add.at(diff, (query, rf1, rt1), values)
+
+        np.cumsum(diff, axis=1, out=diff)
+        np.cumsum(diff, axis=2, out=diff)
+
+        return diff[:, :numFreq, :numTime]
+
+
+    def get_blocks(self, ocw, f0, t0, numFreq: int, numTime: int) -> np.ndarray:
+        """
+        Return the (f0:f0+numFreq, t0:t0+numTime) blocks of a batch of hops as a
+        (numBlocks, numFreq, numTime) array, slots outside the matrix are zero
+        """
+
+        blocks = self.get_signal_blocks(ocw, f0, t0, numFreq, numTime)
+        if self.noise is not None:
+            blocks += self.noise.get_blocks(ocw, f0, t0, numFreq, numTime)
+
+        return blocks.astype(self.dtype)
+
+
+    def get_block(self, ocw: int, f0: int, f1: int, t0: int, t1: int) -> np.ndarray:
+        """
+        Return the dense (f0:f1, t0:t1) block of OCW channel ocw,
+        limits must be already clipped to the matrix shape
+        """
+        return self.get_blocks(ocw, f0, t0, max(f1 - f0, 0), max(t1 - t0, 0))[0]
+
+
+    def toarray(self) -> np.ndarray:
+        """
+        Return dense equivalent matrix
+        """
+        _, F, T = self.shape
+        return np.stack([self.get_block(ocw, 0, F, 0, T) for ocw in range(self.shape[0])])
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            return OCWView(self, key)
+
+        ocw, fslice, tslice = key
+        _, F, T = self.shape
+        f0, f1, _ = fslice.indices(F)
+        t0, t1, _ = tslice.indices(T)
+
+        return self.get_block(ocw, f0, f1, t0, t1)
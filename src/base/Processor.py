@@ -1,11 +1,19 @@
 import numpy as np
 from src.base.base import *
 from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.BlockIndex import BlockIndex
+from src.base.OverlapRcvM import OverlapRcvM
+from src.base.HopTable import HopTable
+from src.base.TransmissionTable import get_column
+from src.base.DtypePolicy import DtypePolicy
 
 class Processor():
     """
     A class for decoding LoRa transmissions. Processor / Demodulator
 
+    Stateless decoding logic, outcomes are returned to the caller and the per
+    decoder counters and decoded logs are kept by DecoderPool.
+
     Args:
         granularity (int): The granularity of the decoding process, in slots.
         CR (int): The coding rate of the LoRa transmissions.
@@ -13,33 +21,24 @@ class Processor():
     Attributes:
         granularity (int): The granularity of the decoding process, in slots.
         CR (int): The coding rate of the LoRa transmissions.
-        _current_tx (LRFHSSTransmission): The current transmission being decoded.
-        _fragment_status (list[int]): Status of each fragment of the current frame.
-        is_busy (bool): Whether the processor is currently decoding a transmission.
-        collided_packets (int): The number of transmissions that have collided.
-        decoded_packets (int): The number of transmissions that have been decoded successfully.
-        decoded_bytes (int): The number of bytes that have been decoded successfully.
 
     Methods:
-        reset(): Resets all counters and states to initial state.
+        get_outcome(tx, rcvM, dynamic, index, geometry): decode outcome of tx and its free up time.
+        get_header_outcome(tx, rcvM, dynamic, index, geometry): header decoding status of tx and its free up time.
+        get_batch_outcomes(transmissions, rcvM, dynamic, index, table): outcomes of a batch of transmissions.
         get_thershold(seq_length: int) -> int:
             Determine the minimum number of fragments needed to successfully
             decode a packet. Two Coding Rates supported:
                 if CR==1 then a 1/3 of fragmenst are required
                 if CR==2 then a 2/3 of fragmenst are required
-        start_decoding(start_event : StartEvent) -> None:
-            Lock processor to the given transmission.
-        finish_decoding(end_event : EndEvent) -> None:
-            Check if the ending trasnmission handed by the gateway corresponds
-            to the one being decoded by this processor then determine the outcome
-            of the transmission and update counters 
-        handle_collision(collision_event : CollisionEvent) -> None:
-            Check if the current transmission being decoded matches the given
-            collision event and if so updates the counter of collided fragments
     """
 
+    # decode outcomes, cases 1 to 4 as in get_outcome
+    NOT_DECODED, DECODED_HDR_PLD, DECODABLE_PLD, DECODED_HDR, COLLIDED_HDR_PLD, HEADER_DROP = range(6)
+
     def __init__(self, CR: int, timeGranularity: int, freqGranularity: int, use_earlydrop: bool,
-                 use_earlydecode: bool, use_headerdrop: bool, baseFreq: int, collision_method: str) -> None:
+                 use_earlydecode: bool, use_headerdrop: bool, baseFreq: int, collision_method: str,
+                 dtypes: DtypePolicy = DtypePolicy()) -> None:
         self.CR = CR
         self.timeGranularity = timeGranularity
         self.freqGranularity = freqGranularity
@@ -51,32 +50,10 @@ class Processor():
         self.baseFreq = baseFreq
         self.collision_method = collision_method
         self.th2 = TH2
+        self.linearTh2 = dBm2mW(TH2) # SINR threshold in linear scale
         self.symbolThreshold = SYM_THRESH
-
-        self.tracked_txs = 0
-        self.decoded_bytes = 0
-        self.header_drop_packets = 0
-        self.decoded_hrd_pld = 0  # case 1
-        self.decoded_hdr = 0      # case 3
-        self.decodable_pld = 0    # case 2
-        self.collided_hdr_pld = 0 # case 4
-        self.decoded = []
-        self.decoded_headers = []
-
-
-    def reset(self) -> None:
-        """
-        Reset all counters and states to initial state
-        """
-        self.tracked_txs = 0
-        self.decoded_bytes = 0
-        self.header_drop_packets = 0
-        self.decoded_hrd_pld = 0  # case 1
-        self.decoded_hdr = 0      # case 3
-        self.decodable_pld = 0    # case 2
-        self.collided_hdr_pld = 0 # case 4
-        self.decoded = []
-        self.decoded_headers = []
+        self.dtypes = dtypes
+        self.noisePower = self.dtypes.power.type(dBm2mW(AWGN_VAR_DB)) # AWGN power in mW
 
 
     def get_minfragments(self, seq_length : int) -> int:
@@ -115,113 +92,304 @@ class Processor():
         timeslots = self.headerSlots if isHdr else self.timeGranularity
 
         for t in range(timeslots):
-            SNIRt_dB = mW2dBm(estSignalPower / max(dBm2mW(AWGN_VAR_DB), interferenceBlock[t]))
+            SNIRt_dB = mW2dBm(estSignalPower / max(self.noisePower, interferenceBlock[t]))
             
             if SNIRt_dB < self.th2:
                 if t==0: return True
                 collidedslots += 1
 
         return (collidedslots/timeslots) > self.symbolThreshold
-    
 
-    def predecode_headers(self, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool) -> int:
+
+    def isCollided_power_batch(self, estSignalPower, interference: np.ndarray) -> np.ndarray:
+        """
+        Vectorized isCollided_power over a (numHops, timeslots) interference array, the
+        signal power is a scalar or one value per hop. SINR is compared in linear scale,
+        a hop is collided if its first slot is or if too many of its slots are
+        """
+
+        interference = np.asarray(interference)
+        if interference.shape[0] == 0:
+            return np.zeros(0, dtype=bool)
+
+        SINR = np.asarray(estSignalPower)[..., np.newaxis] / np.maximum(self.noisePower, interference)
+
+        # negative ratios have no dB value and never collide
+        collidedslots = (SINR < self.linearTh2) & (SINR >= 0)
+        timeslots = interference.shape[-1]
+
+        return collidedslots[..., 0] | (np.count_nonzero(collidedslots, axis=-1) / timeslots > self.symbolThreshold)
+
+
+    def get_collided_hops_power(self, estSignalPower, headersPi: np.ndarray, fragmentsPi: np.ndarray) -> np.ndarray:
+        """
+        SINR collision status of every header/fragment of a transmission
+        """
+        return np.concatenate((self.isCollided_power_batch(estSignalPower, headersPi),
+                               self.isCollided_power_batch(estSignalPower, fragmentsPi)))
+
+
+    def get_hop_table(self, transmissions: list[LRFHSSTransmission], dynamic: bool) -> HopTable:
+        """
+        Per hop geometry of a batch of transmissions
+        """
+        return HopTable(transmissions, dynamic, self.baseFreq, self.freqGranularity,
+                        self.timeGranularity, self.headerSlots)
+
+
+    def get_hop_geometry(self, tx: LRFHSSTransmission, dynamic: bool) -> tuple:
+        """
+        Return (startFreq, endFreq, startTime, endTime) arrays for every header/fragment of tx
+        """
+        return self.get_hop_table([tx], dynamic).get_geometry(0)
+
+
+    def get_collided_hops(self, tx: LRFHSSTransmission, index: BlockIndex, dynamic: bool,
+                          geometry: tuple = None) -> np.ndarray:
+        """
+        Strict collision status of every header/fragment of tx in a single index query
+        """
+        if geometry is None:
+            geometry = self.get_hop_geometry(tx, dynamic)
+        return index.isCollided(tx.ocw, *geometry)
+
+
+    def get_batch_power_estimations(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray,
+                                    table: HopTable) -> tuple:
+        """
+        Batched get_power_estimations. The header/fragment blocks of all transmissions are gathered
+        into a (numHops, freqGranularity, maxSlots) array padded with nan, with fancy indices on dense
+        matrices, a single overlap query on matrix free ones and block queries otherwise. Returns the
+        estimated signal power of each transmission and the (numHops, maxSlots) interference of every
+        hop, nan padded. Values match get_power_estimations up to float rounding
+        """
+
+        txidx, hopidx, ocw = table.txidx, table.hopidx, table.ocw
+        startFreq, endFreq, startTime, endTime = table.startFreq, table.endFreq, table.startTime, table.endTime
+        numTX = len(transmissions)
+        numHops = len(txidx)
+        maxSlots = max(self.headerSlots, self.timeGranularity)
+        duration = endTime - startTime
+
+        slots = np.arange(maxSlots)
+        valid = slots[np.newaxis, :] < duration[:, np.newaxis]
+
+        if isinstance(rcvM, np.ndarray):
+            freq = startFreq[:, np.newaxis] + np.arange(self.freqGranularity)
+            time = np.where(valid, startTime[:, np.newaxis] + slots, startTime[:, np.newaxis])
+            blocks = rcvM[ocw[:, np.newaxis, np.newaxis], freq[:, :, np.newaxis], time[:, np.newaxis, :]]
+            blocks = np.where(valid[:, np.newaxis, :], blocks, np.nan).astype(self.dtypes.power)
+        elif isinstance(rcvM, OverlapRcvM):
+            blocks = rcvM.get_blocks(ocw, startFreq, startTime, self.freqGranularity, maxSlots)
+            blocks = np.where(valid[:, np.newaxis, :], blocks, np.nan).astype(self.dtypes.power)
+        else:
+            blocks = np.full((numHops, self.freqGranularity, maxSlots), np.nan, dtype=self.dtypes.power)
+            for h in range(numHops):
+                blocks[h, :, : duration[h]] = rcvM[ocw[h], startFreq[h] : endFreq[h], startTime[h] : endTime[h]]
+
+        # mean over frequency dimension
+        avgHops = np.mean(blocks, axis=1)
+
+        # per transmission rows, nan padded and sorted with nan last
+        rows = np.full((numTX, hopidx.max() + 1, maxSlots), np.nan, dtype=avgHops.dtype)
+        rows[txidx, hopidx] = avgHops
+        rows = rows.reshape(numTX, -1)
+
+        # filter out interferred symbols, threshold 1 is the median over all frame
+        ordered = np.sort(rows, axis=1)
+        count = np.count_nonzero(~np.isnan(rows), axis=1)
+        lo = ordered[np.arange(numTX), (count - 1) // 2]
+        hi = ordered[np.arange(numTX), count // 2]
+        th1 = np.where(count % 2, lo, (lo + hi) / 2)
+
+        # estimate power over un-interferred symbols based on threshold 1
+        filtered = rows < th1[:, np.newaxis]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estSignalPower = np.sum(np.where(filtered, rows, 0), axis=1) / np.count_nonzero(filtered, axis=1)
+        estSignalPower = estSignalPower.astype(avgHops.dtype)
+
+        # estimate interference power
+        interference = avgHops - estSignalPower[txidx, np.newaxis]
+
+        return estSignalPower, interference
+
+
+    def get_batch_outcomes(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray,
+                           dynamic: bool, index: BlockIndex = None, table: HopTable = None) -> tuple:
+        """
+        Decode of a batch of transmissions without walking their hops. The collision status
+        of every hop, from the block index (strict) or the batched power estimations (SINR),
+        is gathered into a (numTX, maxHops) matrix, the header drop, early decode and early
+        drop points follow from cumulative sums over it. Returns the outcome of each
+        transmission and its free up time, nan if never freed. Results are the same as decode in
+        strict mode, in SINR mode they match up to float rounding of the power estimations, so a
+        hop with a SINR right at the threshold may be classified differently. Counters are updated
+        by DecoderPool.commit_batch. The hop geometry is read from table when given
+        """
+
+        numTX = len(transmissions)
+        if numTX == 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+
+        if table is None:
+            table = self.get_hop_table(transmissions, dynamic)
+
+        lengths = table.lengths
+        numHeaders = table.numHeaders
+        numFragments = get_column(transmissions, 'numFragments', int)
+        txidx, hopidx, endTime = table.txidx, table.hopidx, table.endTime
+
+        if self.collision_method == 'strict':
+            collidedHops = index.isCollided(table.ocw, table.startFreq, table.endFreq, table.startTime, endTime)
+
+        elif self.collision_method == 'SINR':
+            estSignalPower, interference = self.get_batch_power_estimations(transmissions, rcvM, table)
+            isHdr = hopidx < numHeaders[txidx]
+
+            collidedHops = np.zeros(len(txidx), dtype=bool)
+            collidedHops[isHdr] = self.isCollided_power_batch(estSignalPower[txidx[isHdr]],
+                                                              interference[isHdr, : self.headerSlots])
+            collidedHops[~isHdr] = self.isCollided_power_batch(estSignalPower[txidx[~isHdr]],
+                                                               interference[~isHdr, : self.timeGranularity])
+
+        else:
+            raise Exception(f"Collision determination method ```{self.collision_method}``` unknown")
+
+        maxHops = lengths.max()
+        collided = np.zeros((numTX, maxHops), dtype=bool)
+        collided[txidx, hopidx] = collidedHops
+        hopEnd = np.zeros((numTX, maxHops))
+        hopEnd[txidx, hopidx] = endTime
+
+        position = np.arange(maxHops)[np.newaxis, :]
+        isHeader = position < numHeaders[:, np.newaxis]
+        isFragment = ~isHeader & (position < lengths[:, np.newaxis])
+
+        collidedHeaders = np.sum(collided & isHeader, axis=1)
+        headerOK = collidedHeaders < numHeaders
+
+        minFragments = np.ceil(self.CR * numFragments / 3)
+        maxFrgCollisions = numFragments - minFragments
+        decodedFragments = np.cumsum(isFragment & ~collided, axis=1)
+        collidedFragments = np.cumsum(isFragment & collided, axis=1)
+
+        # first fragment stopping the reception, early decode is checked first
+        earlyDecode = self.use_earlydecode & isFragment & (decodedFragments >= minFragments[:, np.newaxis])
+        earlyDrop = self.use_earlydrop & isFragment & (collidedFragments > maxFrgCollisions[:, np.newaxis])
+        stops = earlyDecode | earlyDrop
+        first = np.argmax(stops, axis=1)
+        stopped = stops[np.arange(numTX), first]
+        decodedAtStop = earlyDecode[np.arange(numTX), first]
+
+        outcome = np.full(numTX, self.NOT_DECODED)
+        outcome[stopped & decodedAtStop & headerOK] = self.DECODED_HDR_PLD
+        outcome[stopped & decodedAtStop & ~headerOK] = self.DECODABLE_PLD
+        outcome[stopped & ~decodedAtStop & headerOK] = self.DECODED_HDR
+        outcome[stopped & ~decodedAtStop & ~headerOK] = self.COLLIDED_HDR_PLD
+
+        freeUpTime = np.where(stopped, hopEnd[np.arange(numTX), first], np.nan)
+
+        # collided headers abort the payload reception at the first fragment
+        headerDrop = self.use_headerdrop & ~headerOK & (lengths > numHeaders)
+        outcome[headerDrop] = self.HEADER_DROP
+        freeUpTime[headerDrop] = hopEnd[np.arange(numTX), numHeaders - 1][headerDrop]
+
+        return outcome, freeUpTime
+
+
+    def get_header_outcome(self, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool,
+                           index: BlockIndex = None, geometry: tuple = None) -> tuple:
+        """
+        Header decoding status of tx and free up time
+        """
 
         collided_headers = 0
-        dopplershift = round(tx.dopplerShift[0] / self.freqPerSlot)
 
-        if self.collision_method == 'SINR':
-            estSignalPower, headersPi, fragmentsPi = self.get_power_estimations(tx, rcvM, dynamic)
+        # per header / fragment rectangles
+        if geometry is None:
+            geometry = self.get_hop_geometry(tx, dynamic)
+        startFreq, endFreq, startTime, endTime = geometry
 
-        time = tx.startSlot
-        for fh, obw in enumerate(tx.sequence):
+        # strict collision status of all hops from the block index
+        collided = None
+        if index is not None and self.collision_method == 'strict':
+            collided = self.get_collided_hops(tx, index, dynamic, geometry)
 
-            # variable doppler shift per header / fragment
-            if dynamic:
-                dopplershift = round(tx.dopplerShift[fh] / self.freqPerSlot)
+        # SINR collision status of all hops
+        if self.collision_method == 'SINR':
+            estSignalPower, headersPi, fragmentsPi = self.get_power_estimations(tx, rcvM, dynamic, geometry)
+            collided = self.get_collided_hops_power(estSignalPower, headersPi, fragmentsPi)
 
-            startFreq = self.baseFreq + obw * self.freqGranularity + dopplershift
-            endFreq = startFreq + self.freqGranularity
+        for fh in range(len(tx.sequence)):
 
             # header
             if fh < tx.numHeaders:
 
-                endTime = time + self.headerSlots
-
-                if self.collision_method == 'strict':
-                    args = [rcvM[tx.ocw, startFreq : endFreq, time : endTime]]
-                if self.collision_method == 'SINR':
-                    args = [estSignalPower, headersPi[fh], True]
+                if collided is not None:
+                    hopCollided = collided[fh]
+                else:
+                    args = [rcvM[tx.ocw, startFreq[fh] : endFreq[fh], startTime[fh] : endTime[fh]]]
+                    hopCollided = self.isCollided(args)
 
-                if self.isCollided(args):
+                if hopCollided:
                     collided_headers += 1
-                
-                time = endTime
 
             else: break
 
-        if collided_headers < tx.numHeaders:
-            self.decoded_headers.append(tx)
-        
-        return endTime
+        return collided_headers < tx.numHeaders, int(endTime[min(tx.numHeaders, len(tx.sequence)) - 1])
 
 
-    def decode(self, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool) -> int:
+    def get_outcome(self, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool,
+                    index: BlockIndex = None, geometry: tuple = None) -> tuple:
         """
-        Determine status of incoming transmissions and return free up time
+        Determine the outcome of an incoming transmission and its free up time, None if never freed.
+        With the strict method, collisions are read from the block index when given.
+        The hop rectangles are read from geometry when given.
         """
 
-        self.tracked_txs += 1
         collided_headers = 0
         decoded_fragments = 0
         collided_fragments = 0
 
-        dopplershift = round(tx.dopplerShift[0] / self.freqPerSlot)
         maxFrgCollisions = tx.numFragments - self.get_minfragments(tx.numFragments)
 
-        if self.collision_method == 'SINR':
-            estSignalPower, headersPi, fragmentsPi = self.get_power_estimations(tx, rcvM, dynamic)
+        # per header / fragment rectangles
+        if geometry is None:
+            geometry = self.get_hop_geometry(tx, dynamic)
+        startFreq, endFreq, startTime, endTime = geometry
 
-        time = tx.startSlot
-        for fh, obw in enumerate(tx.sequence):
+        # strict collision status of all hops from the block index
+        collided = None
+        if index is not None and self.collision_method == 'strict':
+            collided = self.get_collided_hops(tx, index, dynamic, geometry)
 
-            # variable doppler shift per header / fragment
-            if dynamic:
-                dopplershift = round(tx.dopplerShift[fh] / self.freqPerSlot)
+        # SINR collision status of all hops
+        if self.collision_method == 'SINR':
+            estSignalPower, headersPi, fragmentsPi = self.get_power_estimations(tx, rcvM, dynamic, geometry)
+            collided = self.get_collided_hops_power(estSignalPower, headersPi, fragmentsPi)
 
-            startFreq = self.baseFreq + obw * self.freqGranularity + dopplershift
-            endFreq = startFreq + self.freqGranularity
+        for fh in range(len(tx.sequence)):
+
+            if collided is not None:
+                hopCollided = collided[fh]
+            else:
+                args = [rcvM[tx.ocw, startFreq[fh] : endFreq[fh], startTime[fh] : endTime[fh]]]
+                hopCollided = self.isCollided(args)
 
             # header
             if fh < tx.numHeaders:
 
-                endTime = time + self.headerSlots
-
-                if self.collision_method == 'strict':
-                    args = [rcvM[tx.ocw, startFreq : endFreq, time : endTime]]
-                if self.collision_method == 'SINR':
-                    args = [estSignalPower, headersPi[fh], True]
-
-                if self.isCollided(args):
+                if hopCollided:
                     collided_headers += 1
-                
-                time = endTime
 
             # fragment
             else:
 
                 # collided header, abort payload reception
                 if self.use_headerdrop and collided_headers == tx.numHeaders:
-                    self.header_drop_packets += 1
-                    return endTime
-
-                endTime = time + self.timeGranularity
+                    return self.HEADER_DROP, int(endTime[fh-1])
 
-                if self.collision_method == 'strict':
-                    args = [rcvM[tx.ocw, startFreq : endFreq, time : endTime]]
-                if self.collision_method == 'SINR':
-                    args = [estSignalPower, fragmentsPi[fh-tx.numHeaders], False]
-
-                if self.isCollided(args):
+                if hopCollided:
                     collided_fragments += 1
                 else:
                     decoded_fragments += 1
@@ -231,61 +399,45 @@ class Processor():
 
                     # case 1
                     if collided_headers < tx.numHeaders:
-                        self.decoded_hrd_pld += 1
-                        self.decoded_bytes += tx.payload_size
-                        self.decoded.append([tx, 1])
+                        return self.DECODED_HDR_PLD, int(endTime[fh])
 
                     # case 2
-                    else:
-                        self.decodable_pld += 1
-
-                    return endTime
+                    return self.DECODABLE_PLD, int(endTime[fh])
 
                 # early drop - collided payload
                 if self.use_earlydrop and collided_fragments > maxFrgCollisions:
                     
                     # case 3
                     if collided_headers < tx.numHeaders:
-                        self.decoded_hdr += 1
-                        self.decoded.append([tx, 0])
+                        return self.DECODED_HDR, int(endTime[fh])
 
                     # case 4
-                    else:
-                        self.collided_hdr_pld += 1
-                    
-                    return endTime
+                    return self.COLLIDED_HDR_PLD, int(endTime[fh])
 
-                time = endTime
+        return self.NOT_DECODED, None
         
 
-    def get_power_estimations(self, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool) -> bool:
+    def get_power_estimations(self, tx: LRFHSSTransmission, rcvM: np.ndarray, dynamic: bool,
+                              geometry: tuple = None) -> bool:
 
-        dopplershift = round(tx.dopplerShift[0] / self.freqPerSlot)
+        if geometry is None:
+            geometry = self.get_hop_geometry(tx, dynamic)
+        startFreq, endFreq, startTime, endTime = geometry
 
-        headers = np.zeros((tx.numHeaders, self.freqGranularity, self.headerSlots))
-        fragments = np.zeros((tx.numFragments, self.freqGranularity, self.timeGranularity))
+        headers = np.zeros((tx.numHeaders, self.freqGranularity, self.headerSlots), dtype=self.dtypes.power)
+        fragments = np.zeros((tx.numFragments, self.freqGranularity, self.timeGranularity), dtype=self.dtypes.power)
 
-        time = tx.startSlot
-        for fh, obw in enumerate(tx.sequence):
+        for fh in range(len(tx.sequence)):
 
-            # variable doppler shift per header / fragment
-            if dynamic:
-                dopplershift = round(tx.dopplerShift[fh] / self.freqPerSlot)
-
-            startFreq = self.baseFreq + obw * self.freqGranularity + dopplershift
-            endFreq = startFreq + self.freqGranularity
+            block = rcvM[tx.ocw, startFreq[fh] : endFreq[fh], startTime[fh] : endTime[fh]]
 
             # header
             if fh < tx.numHeaders:
-                endTime = time + self.headerSlots
-                headers[fh] = rcvM[tx.ocw, startFreq : endFreq, time : endTime]
+                headers[fh] = block
 
             # fragment
             else:
-                endTime = time + self.timeGranularity
-                fragments[fh-tx.numHeaders] = rcvM[tx.ocw, startFreq : endFreq, time : endTime]
-            
-            time = endTime
+                fragments[fh-tx.numHeaders] = block
 
         # mean over frequency dimension
         avgHeaders = np.mean(headers, axis=1)     # (numHeaders, 1, headerSlots)
@@ -0,0 +1,147 @@
+import numpy as np
+from src.base.NoiseField import NoiseField
+
+
+class SparseRcvM():
+    """
+    Interval based received matrix. Every header/fragment is stored as a
+    (ocw, f0, f1, t0, t1, value) rectangle instead of being written into a dense
+    (numOCW, frequencySlots, simTime) array, dense blocks are only created
+    for the slices requested by the decoders and the FHS locator.
+
+    Args:
+        shape (tuple[int]): shape of the equivalent dense matrix (numOCW, frequencySlots, simTime)
+        noise (NoiseField): noise layer added to each queried block, None for count matrices.
+
+    Attributes:
+        shape (tuple[int]): shape of the equivalent dense matrix.
+        ndim (int): number of dimensions of the equivalent dense matrix.
+        noise (NoiseField): noise layer, the noise of a slot is the same in every query.
+
+    Methods:
+        add(ocw, f0, f1, t0, t1, value): store a new rectangle.
+        get_block(ocw, f0, f1, t0, t1): dense block for the given coordinates.
+        toarray(): dense equivalent matrix.
+    """
+
+    def __init__(self, shape: tuple, noise: NoiseField = None) -> None:
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.noise = noise
+
+        self._rects = [[] for _ in range(self.shape[0])]
+        self._index = [None] * self.shape[0]
+
+
+    def add(self, ocw: int, f0: int, f1: int, t0: int, t1: int, value: float) -> None:
+        """
+        Store a (f0:f1, t0:t1) rectangle with the given value in OCW channel ocw
+        """
+        self._rects[ocw].append((f0, f1, t0, t1, value))
+        self._index[ocw] = None
+
+
+    def get_index(self, ocw: int) -> tuple:
+        """
+        Return the interval index of OCW channel ocw, rectangles sorted by start time
+        and the maximum rectangle duration, the index is rebuilt after every insertion
+        """
+
+        if self._index[ocw] is None:
+
+            rects = np.asarray(self._rects[ocw], dtype=float).reshape(-1, 5)
+            rects = rects[np.argsort(rects[:, 2], kind='stable')]
+
+            f0, f1, t0, t1 = rects[:, :4].astype(int).T
+            maxDuration = (t1 - t0).max() if len(rects) else 0
+
+            self._index[ocw] = (f0, f1, t0, t1, rects[:, 4], maxDuration)
+
+        return self._index[ocw]
+
+
+    def get_block(self, ocw: int, f0: int, f1: int, t0: int, t1: int) -> np.ndarray:
+        """
+        Return the dense (f0:f1, t0:t1) block of OCW channel ocw,
+        limits must be already clipped to the matrix shape
+        """
+
+        block = np.zeros((max(f1 - f0, 0), max(t1 - t0, 0)))
+        if self.noise is not None:
+            block += self.noise.get_block(ocw, f0, f1, t0, t1)
+
+        if block.size == 0:
+            return block
+
+        rf0, rf1, rt0, rt1, values, maxDuration = self.get_index(ocw)
+
+        # only rectangles starting in ]t0 - maxDuration, t1[ can reach the block
+        lo = np.searchsorted(rt0, t0 - maxDuration, side='right')
+        hi = np.searchsorted(rt0, t1, side='left')
+
+        for i in range(lo, hi):
+
+            if rt1[i] <= t0 or rf1[i] <= f0 or rf0[i] >= f1:
+                continue
+
+            block[max(rf0[i], f0) - f0 : min(rf1[i], f1) - f0,
+                  max(rt0[i], t0) - t0 : min(rt1[i], t1) - t0] += values[i]
+
+        return block
+
+
+    def toarray(self) -> np.ndarray:
+        """
+        Return dense equivalent matrix
+        """
+        _, F, T = self.shape
+        return np.stack([self.get_block(ocw, 0, F, 0, T) for ocw in range(self.shape[0])])
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            return OCWView(self, key)
+
+        ocw, fslice, tslice = key
+        _, F, T = self.shape
+        f0, f1, _ = fslice.indices(F)
+        t0, t1, _ = tslice.indices(T)
+
+        return self.get_block(ocw, f0, f1, t0, t1)
+
+
+
+class OCWView():
+    """
+    Two dimensional (frequencySlots, simTime) view of a single OCW channel
+    of a non dense received matrix, any matrix implementing get_block
+
+    Args:
+        rcvM (SparseRcvM): sparse or memory mapped received matrix.
+        ocw (int): OCW channel.
+    """
+
+    def __init__(self, rcvM, ocw: int) -> None:
+        self.rcvM = rcvM
+        self.ocw = ocw
+        self.shape = rcvM.shape[1:]
+        self.ndim = 2
+
+
+    def toarray(self) -> np.ndarray:
+        F, T = self.shape
+        return self.rcvM.get_block(self.ocw, 0, F, 0, T)
+
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+
+    def __getitem__(self, key) -> np.ndarray:
+        fslice, tslice = key
+        return self.rcvM[self.ocw, fslice, tslice]
@@ -0,0 +1,134 @@
+import numpy as np
+from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.MatrixBuilder import MatrixBuilder
+
+
+class Spectrogram():
+    """
+    Mutable received matrix, transmissions can be added or removed touching
+    only their own header/fragment rectangles instead of rebuilding the matrix.
+    Every modified rectangle is recorded as a dirty region so downstream consumers
+    can re-evaluate only the transmissions that overlap them. Binary (bool)
+    spectrograms only support additions.
+
+    Args:
+        builder (MatrixBuilder): hop geometry of the transmissions.
+        matrix (np.ndarray): initial (numOCW, frequencySlots, simTime) matrix, modified in place.
+        power (bool): power based matrix flag, counts otherwise.
+        dynamic (bool): dynamic doppler flag.
+        transmissions (list[LRFHSSTransmission]): transmissions already present in matrix, none by default.
+
+    Attributes:
+        matrix (np.ndarray): current received matrix.
+        members (dict[int, LRFHSSTransmission]): transmissions present in the matrix by id.
+        dirty (list[tuple]): modified (ocw, f0, f1, t0, t1) rectangles, clipped to the matrix.
+
+    Methods:
+        add(tx): write transmission tx into the matrix.
+        remove(tx): erase transmission tx from the matrix.
+        apply(delta_set): add/remove a set of transmissions.
+        get_affected(transmissions): transmissions overlapping a dirty region.
+        clear_dirty(): forget all dirty regions.
+    """
+
+    def __init__(self, builder: MatrixBuilder, matrix: np.ndarray, power: bool, dynamic: bool,
+                 transmissions: list[LRFHSSTransmission] = None) -> None:
+        self.builder = builder
+        self.matrix = matrix
+        self.power = power
+        self.dynamic = dynamic
+        self.members = {tx.id: tx for tx in (transmissions or [])}
+        self.dirty = []
+
+
+    def _write(self, transmissions: list[LRFHSSTransmission], sign: int) -> None:
+
+        if self.matrix.dtype == bool and sign < 0:
+            raise Exception("Transmissions cannot be removed from a binary spectrogram")
+
+        ocw, f0, f1, t0, t1, values = self.builder.get_hops(transmissions, self.power, self.dynamic)
+
+        # same clipping as scatter_blocks, negative limits would wrap around otherwise
+        _, F, T = self.matrix.shape
+        f0, f1 = np.clip(f0, 0, F), np.clip(f1, 0, F)
+        t0, t1 = np.clip(t0, 0, T), np.clip(t1, 0, T)
+
+        for ocw, f0, f1, t0, t1, value in zip(ocw, f0, f1, t0, t1, values):
+
+            if f0 >= f1 or t0 >= t1:
+                continue
+
+            if self.matrix.dtype == bool:
+                self.matrix[ocw, f0 : f1, t0 : t1] = True
+            elif sign > 0:
+                self.matrix[ocw, f0 : f1, t0 : t1] += self.matrix.dtype.type(value)
+            else:
+                self.matrix[ocw, f0 : f1, t0 : t1] -= self.matrix.dtype.type(value)
+
+            self.dirty.append((ocw, f0, f1, t0, t1))
+
+
+    def add(self, tx: LRFHSSTransmission) -> None:
+        """
+        Write transmission tx into the matrix
+        """
+        self._write([tx], 1)
+        self.members[tx.id] = tx
+
+
+    def remove(self, tx: LRFHSSTransmission) -> None:
+        """
+        Erase transmission tx from the matrix
+        """
+        self._write([tx], -1)
+        self.members.pop(tx.id, None)
+
+
+    def apply(self, delta_set: list[tuple]) -> None:
+        """
+        Apply a set of (tx, sign) changes, sign 1 adds tx and -1 removes it
+        """
+
+        added = [tx for tx, sign in delta_set if sign > 0]
+        removed = [tx for tx, sign in delta_set if sign < 0]
+
+        if len(added):
+            self._write(added, 1)
+        if len(removed):
+            self._write(removed, -1)
+
+        for tx in added:
+            self.members[tx.id] = tx
+        for tx in removed:
+            self.members.pop(tx.id, None)
+
+
+    def get_affected(self, transmissions: list[LRFHSSTransmission] = None) -> list[LRFHSSTransmission]:
+        """
+        Return the transmissions with any header/fragment overlapping a dirty
+        region, by default among the transmissions present in the matrix
+        """
+
+        if transmissions is None:
+            transmissions = list(self.members.values())
+
+        if len(transmissions) == 0 or len(self.dirty) == 0:
+            return []
+
+        txidx = np.repeat(np.arange(len(transmissions)), [len(tx.sequence) for tx in transmissions])
+        ocw, f0, f1, t0, t1, _ = self.builder.get_hops(transmissions, False, self.dynamic)
+        docw, df0, df1, dt0, dt1 = np.asarray(self.dirty).T
+
+        affected = np.zeros(len(transmissions), dtype=bool)
+        for d in range(len(docw)):
+            overlap = (ocw == docw[d]) & (f0 < df1[d]) & (f1 > df0[d]) & (t0 < dt1[d]) & (t1 > dt0[d])
+            affected[txidx[overlap]] = True
+
+        return [tx for tx, a in zip(transmissions, affected) if a]
+
+
+    def clear_dirty(self) -> None:
+        """
+        Forget all dirty regions, usually after downstream consumers are updated
+        """
+        self.dirty = []
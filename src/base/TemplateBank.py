@@ -0,0 +1,165 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+
+class TemplateBank():
+    """
+    Precomputed hop windows of every (sequence, static doppler shift) candidate searched
+    by the FHS locator. Entry (s, d, h) is the first frequency slot of hop h of sequence s,
+    relative to the locator base frequency, when the transmission starts with the static
+    shift d - maxDopplerSlots, the doppler drift along the transmission is already applied.
+    Hop start times relative to the transmission start only depend on the hop index.
+
+    The frequency tensor is stored as a .npy file named after the family, region,
+    granularity and a digest of the sequences and locator parameters, and loaded with
+    memory mapping. Pickled banks reopen the file, so pool workers share the same pages.
+
+    Args:
+        path (str): .npy file with the (numSeqs, numDopplerStarts, maxHops) frequency tensor.
+        seqs (list): sequences of the bank, in tensor row order.
+        timeOffsets (np.ndarray): start time of every hop relative to the transmission start.
+        timeLengths (np.ndarray): time slots of every hop.
+
+    Attributes:
+        freqs (np.ndarray): memory mapped frequency tensor.
+        lengths (np.ndarray): length of every sequence, hops above it are padding.
+        timeOffsets, timeLengths (np.ndarray): hop timing.
+        hopTimes (list[tuple]): (timeOffset, timeLength) of every hop.
+
+    Methods:
+        get_row(seq): tensor row of a sequence, -1 if it is not in the bank.
+        get_key(family, region, locator, seqs): file name of a bank.
+        build(locator, seqs): frequency tensor of a bank.
+        load(locator, seqs, family, region, directory): bank from directory, built and saved if missing.
+    """
+
+    def __init__(self, path: str, seqs: list, timeOffsets: np.ndarray, timeLengths: np.ndarray) -> None:
+        self.path = path
+        self.timeOffsets = np.asarray(timeOffsets, dtype=int)
+        self.timeLengths = np.asarray(timeLengths, dtype=int)
+        self.hopTimes = list(zip(self.timeOffsets.tolist(), self.timeLengths.tolist()))
+        self.lengths = np.array([len(seq) for seq in seqs], dtype=int)
+
+        # first row of every sequence, families may repeat sequences
+        self._rows = {}
+        for s, seq in enumerate(seqs):
+            self._rows.setdefault(tuple(int(v) for v in seq), s)
+
+        self.freqs = self.open(path)
+
+
+    @staticmethod
+    def open(path: str) -> np.ndarray:
+        """
+        Memory mapped tensor as a plain array view, element reads skip the memmap subclass
+        """
+        return np.asarray(np.load(path, mmap_mode='r'))
+
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['freqs']
+        return state
+
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.freqs = self.open(self.path)
+
+
+    def get_row(self, seq) -> int:
+        return self._rows.get(tuple(int(v) for v in seq), -1)
+
+
+    @staticmethod
+    def get_hop_timing(locator, maxHops: int) -> tuple:
+        """
+        Start time offset and time slots of every hop, headers first
+        """
+
+        h = np.arange(maxHops)
+        numHdrs = np.minimum(h, locator.numHeaders)
+        numFrgs = np.maximum(h - locator.numHeaders, 0)
+
+        timeOffsets = numHdrs * locator.headerSlots + numFrgs * locator.timeGranularity
+        timeLengths = np.where(h < locator.numHeaders, locator.headerSlots, locator.timeGranularity)
+
+        return timeOffsets, timeLengths
+
+
+    @staticmethod
+    def build(locator, seqs: list) -> np.ndarray:
+        """
+        Frequency tensor of the given sequences, same windows as
+        FHSLocator.isPossibeShift for every static shift of the locator search
+        """
+
+        maxHops = max(len(seq) for seq in seqs)
+        seqM = np.zeros((len(seqs), maxHops), dtype=np.int64)
+        for s, seq in enumerate(seqs):
+            seqM[s, :len(seq)] = seq
+
+        # doppler table index of every (static shift, hop), the index moves
+        # back DSperHdr/DSperFrg entries after every header/fragment
+        h = np.arange(maxHops)
+        drift = np.minimum(h, locator.numHeaders) * locator.DSperHdr \
+              + np.maximum(h - locator.numHeaders, 0) * locator.DSperFrg
+        DSidx = locator.staticShiftIdx[:, np.newaxis] - drift[np.newaxis, :]
+
+        # negative indices wrap around as in the scalar search
+        DSslots = np.take(locator.DSslots, DSidx, mode='wrap')
+
+        freqs = seqM[:, np.newaxis, :] * locator.freqGranularity + DSslots[np.newaxis] - 1
+
+        dtype = np.int16 if np.iinfo(np.int16).min <= freqs.min() and freqs.max() <= np.iinfo(np.int16).max \
+                else np.int32
+
+        return freqs.astype(dtype)
+
+
+    @staticmethod
+    def get_key(family: str, region: str, locator, seqs: list) -> str:
+        """
+        File name of the bank of the given sequences, the digest covers the
+        sequences and every locator parameter the tensor depends on
+        """
+
+        digest = hashlib.sha1()
+        for seq in seqs:
+            digest.update(np.asarray(seq, dtype=np.int64).tobytes())
+            digest.update(b'|')
+
+        params = np.array([locator.numHeaders, locator.freqGranularity, locator.DSperHdr,
+                           locator.DSperFrg, locator.maxDopplerSlots], dtype=np.int64)
+        digest.update(params.tobytes())
+        digest.update(np.asarray(locator.staticShiftIdx, dtype=np.int64).tobytes())
+        digest.update(np.asarray(locator.DSslots, dtype=np.int64).tobytes())
+
+        granularity = f"{locator.timeGranularity}x{locator.freqGranularity}"
+        return f"{family}_{region}_{granularity}_{digest.hexdigest()[:16]}.npy"
+
+
+    @staticmethod
+    def load(locator, seqs: list, family: str, region: str, directory: str) -> 'TemplateBank':
+        """
+        Bank of the given sequences from directory, built and saved the first time
+        """
+
+        seqs = list(seqs)
+        path = os.path.join(directory, TemplateBank.get_key(family, region, locator, seqs))
+        maxHops = max(len(seq) for seq in seqs)
+
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            freqs = TemplateBank.build(locator, seqs)
+
+            # written under a temporary name, concurrent builders never see a partial file
+            fd, tmp = tempfile.mkstemp(suffix='.npy', dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, freqs)
+            os.replace(tmp, path)
+
+        timeOffsets, timeLengths = TemplateBank.get_hop_timing(locator, maxHops)
+        return TemplateBank(path, seqs, timeOffsets, timeLengths)
@@ -0,0 +1,241 @@
+import numpy as np
+from src.base.LRFHSSTransmission import LRFHSSTransmission
+
+
+def get_column(transmissions, name: str, dtype=None) -> np.ndarray:
+    """
+    Attribute of every transmission as an array, read from the columns
+    of a TransmissionTable or gathered from a list of transmissions
+    """
+
+    if isinstance(transmissions, TransmissionTable):
+        return transmissions.records[name] if dtype is None else transmissions.records[name].astype(dtype)
+
+    return np.array([getattr(tx, name) for tx in transmissions], dtype=dtype)
+
+
+def ragged_index(offsets: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """
+    Flat positions of the entries of rows idx of a ragged array with the given offsets
+    """
+
+    lengths = offsets[idx + 1] - offsets[idx]
+    starts = offsets[idx] - (np.cumsum(lengths) - lengths)
+
+    return np.repeat(starts, lengths) + np.arange(lengths.sum())
+
+
+class TransmissionTable():
+    """
+    Columnar transmission set. Scalar attributes are fields of a structured array,
+    sequences and doppler shifts are ragged arrays, the values of transmission k are
+    the entries offsets[k]:offsets[k+1] (dopplerOffsets for the doppler shifts).
+    Transmissions are materialized as LRFHSSTransmission objects only when indexed
+    or iterated, tables built from objects return the original ones.
+
+    Args:
+        records (np.ndarray): structured array with the record_dtype fields.
+        sequences (np.ndarray): concatenated frequency hopping sequences.
+        lengths (np.ndarray): sequence length of every transmission.
+        doppler (np.ndarray): concatenated doppler shifts.
+        dopplerLengths (np.ndarray): doppler shifts of every transmission.
+        objects (list[LRFHSSTransmission]): transmissions described by the table, None to materialize them.
+
+    Attributes:
+        records (np.ndarray): per transmission fields.
+        sequences, offsets (np.ndarray): ragged frequency hopping sequences.
+        doppler, dopplerOffsets (np.ndarray): ragged doppler shifts.
+        lengths (np.ndarray): sequence length of every transmission.
+        ids (np.ndarray): transmission identifiers.
+
+    Methods:
+        from_transmissions(transmissions): table of a list of transmissions.
+        select(idx): table of the transmissions at the given positions or mask.
+        sort(): table sorted by start slot, ties keep their order.
+        get_sequence(k), get_doppler(k): ragged values of transmission k.
+        isin(ids): mask of the transmissions whose id is in ids.
+        index_of(ids): positions of the given ids, -1 if missing.
+        intersection(other), difference(other), union(other): id based set operations.
+        get_triples(): (startSlot, seqid, seqlength) of every transmission, as used by the FHS locator.
+    """
+
+    record_dtype = np.dtype([('id', np.int64), ('node_id', np.int64), ('startSlot', np.int64), ('ocw', np.int64),
+                             ('numHeaders', np.int64), ('payload_size', np.int64), ('numFragments', np.int64),
+                             ('seqid', np.int64), ('distance', np.float64), ('power', np.float64)])
+
+    def __init__(self, records: np.ndarray, sequences: np.ndarray, lengths: np.ndarray,
+                 doppler: np.ndarray, dopplerLengths: np.ndarray, objects: list = None) -> None:
+
+        self.records = records
+        self.sequences = np.asarray(sequences, dtype=int)
+        self.lengths = np.asarray(lengths, dtype=int)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths))).astype(int)
+        self.doppler = np.asarray(doppler, dtype=float)
+        self.dopplerOffsets = np.concatenate(([0], np.cumsum(dopplerLengths))).astype(int)
+        self._objects = objects
+
+        # id lookups, ids sorted once
+        self._idorder = np.argsort(self.records['id'], kind='stable')
+
+
+    @staticmethod
+    def from_transmissions(transmissions: list[LRFHSSTransmission]) -> 'TransmissionTable':
+        """
+        Table of a list of transmissions, indexing the table returns the given objects
+        """
+
+        if isinstance(transmissions, TransmissionTable):
+            return transmissions
+
+        records = np.zeros(len(transmissions), dtype=TransmissionTable.record_dtype)
+        for name in TransmissionTable.record_dtype.names:
+            records[name] = [getattr(tx, name) for tx in transmissions]
+
+        lengths = [len(tx.sequence) for tx in transmissions]
+        dopplerLengths = [len(tx.dopplerShift) for tx in transmissions]
+        sequences = np.concatenate([np.asarray(tx.sequence, dtype=int) for tx in transmissions]) \
+                    if len(transmissions) else np.zeros(0, dtype=int)
+        doppler = np.concatenate([np.asarray(tx.dopplerShift, dtype=float) for tx in transmissions]) \
+                  if len(transmissions) else np.zeros(0)
+
+        return TransmissionTable(records, sequences, lengths, doppler, dopplerLengths, list(transmissions))
+
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.records['id']
+
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+    def get_sequence(self, k: int) -> np.ndarray:
+        return self.sequences[self.offsets[k] : self.offsets[k+1]]
+
+
+    def get_doppler(self, k: int) -> np.ndarray:
+        return self.doppler[self.dopplerOffsets[k] : self.dopplerOffsets[k+1]]
+
+
+    def get_transmission(self, k: int) -> LRFHSSTransmission:
+        """
+        Transmission k as an object, built from the columns the first time it is requested
+        """
+
+        if self._objects is None:
+            self._objects = [None] * len(self)
+
+        if self._objects[k] is None:
+            r = self.records[k]
+            self._objects[k] = LRFHSSTransmission(int(r['id']), int(r['node_id']), int(r['startSlot']), int(r['ocw']),
+                                                  int(r['numHeaders']), int(r['payload_size']),
+                                                  int(r['numFragments']), self.get_sequence(k).tolist(),
+                                                  int(r['seqid']), float(r['distance']),
+                                                  self.get_doppler(k).tolist(), float(r['power']))
+
+        return self._objects[k]
+
+
+    def __getitem__(self, key):
+
+        if isinstance(key, (int, np.integer)):
+            return self.get_transmission(key if key >= 0 else len(self) + key)
+
+        return self.select(np.arange(len(self))[key])
+
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.get_transmission(k)
+
+
+    def select(self, idx) -> 'TransmissionTable':
+        """
+        Table of the transmissions at the given positions or boolean mask, in the given order
+        """
+
+        idx = np.arange(len(self))[idx] if np.asarray(idx).dtype == bool else np.asarray(idx, dtype=int)
+
+        seqidx = ragged_index(self.offsets, idx)
+        dopidx = ragged_index(self.dopplerOffsets, idx)
+
+        objects = None if self._objects is None else [self._objects[k] for k in idx]
+
+        return TransmissionTable(self.records[idx], self.sequences[seqidx], self.lengths[idx],
+                                 self.doppler[dopidx], np.diff(self.dopplerOffsets)[idx], objects)
+
+
+    def sort(self) -> 'TransmissionTable':
+        """
+        Table sorted by start slot, same order as sorting the transmission objects
+        """
+        return self.select(np.argsort(self.records['startSlot'], kind='stable'))
+
+
+    def index_of(self, ids) -> np.ndarray:
+        """
+        Position of every given id in the table, -1 if the id is missing
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(ids), -1)
+
+        sortedIds = self.records['id'][self._idorder]
+        pos = np.minimum(np.searchsorted(sortedIds, ids), len(sortedIds) - 1)
+
+        return np.where(sortedIds[pos] == ids, self._idorder[pos], -1)
+
+
+    def isin(self, ids) -> np.ndarray:
+        """
+        Mask of the transmissions whose id is in ids, ids can be another table or a list of transmissions
+        """
+
+        if isinstance(ids, TransmissionTable):
+            ids = ids.ids
+        elif len(ids) and isinstance(ids[0], LRFHSSTransmission):
+            ids = [tx.id for tx in ids]
+
+        return np.isin(self.records['id'], np.asarray(ids, dtype=np.int64))
+
+
+    def intersection(self, other) -> 'TransmissionTable':
+        return self.select(self.isin(other))
+
+
+    def difference(self, other) -> 'TransmissionTable':
+        return self.select(~self.isin(other))
+
+
+    def union(self, other) -> 'TransmissionTable':
+        """
+        Transmissions of this table followed by the ones of other with a new id
+        """
+        other = TransmissionTable.from_transmissions(other)
+        return concatenate([self, other.difference(self)])
+
+
+    def get_triples(self) -> list[tuple]:
+        """
+        (startSlot, seqid, seqlength) of every transmission
+        """
+        return list(zip(self.records['startSlot'].tolist(), self.records['seqid'].tolist(), self.lengths.tolist()))
+
+
+
+def concatenate(tables: list[TransmissionTable]) -> TransmissionTable:
+    """
+    Single table with the transmissions of all tables in order
+    """
+
+    objects = None
+    if all(table._objects is not None for table in tables):
+        objects = [tx for table in tables for tx in table._objects]
+
+    return TransmissionTable(np.concatenate([table.records for table in tables]),
+                             np.concatenate([table.sequences for table in tables]),
+                             np.concatenate([table.lengths for table in tables]),
+                             np.concatenate([table.doppler for table in tables]),
+                             np.concatenate([np.diff(table.dopplerOffsets) for table in tables]), objects)
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+class WindowedRcvM():
+    """
+    Dense received matrix covering only the time slots [timeOffset, timeOffset + windowTime[,
+    indexed with absolute time slots, used by the streaming simulation mode.
+
+    Args:
+        matrix (np.ndarray): (numOCW, frequencySlots, windowTime) received matrix.
+        timeOffset (int): absolute time slot of the first matrix column.
+
+    Attributes:
+        matrix (np.ndarray): received matrix of the window.
+        timeOffset (int): absolute time slot of the first matrix column.
+    """
+
+    def __init__(self, matrix: np.ndarray, timeOffset: int) -> None:
+        self.matrix = matrix
+        self.timeOffset = timeOffset
+        self.shape = matrix.shape
+        self.ndim = matrix.ndim
+        self.dtype = matrix.dtype
+
+
+    def __getitem__(self, key) -> np.ndarray:
+
+        ocw, fslice, tslice = key
+        start = None if tslice.start is None else tslice.start - self.timeOffset
+        stop = None if tslice.stop is None else tslice.stop - self.timeOffset
+
+        return self.matrix[ocw, fslice, start : stop]
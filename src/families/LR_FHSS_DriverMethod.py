@@ -39,6 +39,7 @@ class LR_FHSS_DriverFamily(FHSfamily):
 
     def __init__(self, q, regionDR) -> None:
         super().__init__(q)
+        self.regionDR = regionDR
         self.init_params(regionDR)
         self.FHSfam = self.set_family()
 
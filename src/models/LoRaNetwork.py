@@ -1,29 +1,104 @@
+import copy
 import time
 import galois
 import random
 import numpy as np
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from src.base.base import *
 from src.base.LoRaNode import LoRaNode
 from src.base.LoRaGateway import LoRaGateway
+from src.base.Processor import Processor
 from src.base.LRFHSSTransmission import LRFHSSTransmission
+from src.base.TransmissionTable import TransmissionTable
+from src.base.SparseRcvM import SparseRcvM
+from src.base.MemmapRcvM import MemmapRcvM
+from src.base.OverlapRcvM import OverlapRcvM
+from src.base.WindowedRcvM import WindowedRcvM
+from src.base.NoiseField import NoiseField
+from src.base.NoisyRcvM import NoisyRcvM
+from src.base.MatrixBuilder import MatrixBuilder, scatter_blocks
+from src.base.HopTable import HopTable, get_hop_times
+from src.base.DopplerModel import get_doppler_model
+from src.base.DtypePolicy import DtypePolicy
+from src.base.Spectrogram import Spectrogram
 from src.families.LiFanMethod import LiFanFamily
 from src.families.LR_FHSS_DriverMethod import LR_FHSS_DriverFamily
 from src.families.LempelGreenbergMethod import LempelGreenbergFamily
 from src.base.FHSLocator import FHSLocator
 
 
+def _run_gateway(args) -> list:
+    """
+    Pool worker of LoRaNetwork.run_parallel and run_gateways, builds the received matrix
+    of the given transmissions and decodes them, returns the used decoder pool.
+    The hop table is built in the worker if not given. In power mode the noise
+    is read from the given noise field, added to the dense matrix or kept as a
+    lazy layer depending on noise_mode
+    """
+
+    gateway, builder, transmissions, table, power, dynamic, noiseField, noise_mode = args
+
+    if table is None:
+        table = builder.get_hop_table(transmissions, dynamic)
+    rcvM = builder.get_rcvM(transmissions, power, dynamic, table)
+    if power and noise_mode == "lazy":
+        rcvM = NoisyRcvM(rcvM, noiseField)
+    elif power:
+        _, F, T = rcvM.shape
+        for c in range(rcvM.shape[0]):
+            rcvM[c] += noiseField.get_block(c, 0, F, 0, T)
+
+    gateway.run(transmissions, rcvM, dynamic, table=table)
+    return gateway._decoders
+
+
 class LoRaNetwork():
 
+    # best first, macro diversity keeps the best outcome of a transmission over all gateways
+    combined_outcome_rank = (Processor.DECODED_HDR_PLD, Processor.DECODED_HDR, Processor.DECODABLE_PLD,
+                             Processor.COLLIDED_HDR_PLD, Processor.HEADER_DROP, Processor.NOT_DECODED)
+
     def __init__(self, numNodes, familyname, numOCW, numOBW, numGrids, CR, timeGranularity, freqGranularity,
-                 simTime, numDecoders, use_earlydecode, use_earlydrop, use_headerdrop, collision_method) -> None:
+                 simTime, numDecoders, use_earlydecode, use_earlydrop, use_headerdrop, collision_method,
+                 rcvM_backend="dense", dtype_policy="default", rcvM_cache_size=2,
+                 scratch_dir=None, memmap_chunk=1024, noise_mode="dense", scheduler="firstfit",
+                 numGateways=1, gateway_seed=0, traffic="nodes", traffic_seed=None, template_dir=None,
+                 locator="exhaustive", rcvM_cache_power=False) -> None:
         
         self.numOCW = numOCW
+        self.CR = CR
         self.numOBW = numOBW
         self.simTime = simTime
         self.numNodes = numNodes
         self.timeGranularity = timeGranularity # time slots per fragmet
         self.freqGranularity = freqGranularity # freq slots per OBW
         self.use_earlydecode = use_earlydecode
+        self.rcvM_backend = rcvM_backend       # received matrix storage, "dense" / "sparse" / "memmap" / "overlap"
+        self.scratch_dir = scratch_dir         # memmap backend files directory, temporary if None
+        self.memmap_chunk = memmap_chunk       # memmap backend time slots per chunk
+        self.noise_mode = noise_mode           # power noise, "dense" / "lazy", sparse and overlap backends are always lazy
+        if noise_mode not in ("dense", "lazy"):
+            raise Exception(f"Invalid noise mode '{noise_mode}'")
+        self.dtypes = DtypePolicy.get_policy(dtype_policy) # matrices data types
+        self.rcvM_cache_size = rcvM_cache_size # max received matrices kept per TXset
+        self.rcvM_cache_power = rcvM_cache_power # cache power matrices too, their noise is then reused
+        self._rcvM_cache = OrderedDict()
+        self._hop_tables = {}
+        self._gateway_TXsets = {}
+        self._TXtables = {}
+        self.numGateways = numGateways         # gateways (satellites) receiving the same traffic
+        self._gateway_rng = np.random.default_rng(gateway_seed) # geometry of the extra gateways
+        self.traffic = traffic                 # traffic generator, "nodes" / "bulk"
+        if traffic == "bulk" and traffic_seed is None: # bulk traffic follows the random module seed by default
+            traffic_seed = random.getrandbits(64)
+        self._traffic_rng = np.random.default_rng(traffic_seed)
+        self.doppler = get_doppler_model()     # doppler shift table shared with the nodes
+        self.template_dir = template_dir       # FHS locator template bank directory, no bank if None
+        self.locator = locator                 # FHS locator search, "exhaustive" / "vectorized" / "matched" / "candidates"
+        self.TXversion = 0
+        self.familyname = familyname
         self.FHSfam = self.set_FHSfamily(familyname, numGrids)
 
         ###########################
@@ -52,14 +127,21 @@ class LoRaNetwork():
         ###########################
 
         max_packet_duration = MAX_HDRS * self.headerSlots + MAX_FRGS * timeGranularity
+        self.max_packet_duration = max_packet_duration # MAX_FRM_TM in time slots
         startLimit = simTime - max_packet_duration
+        self.startLimit = startLimit
         self.nodes = [LoRaNode(i, CR, numOCW, startLimit) for i in range(numNodes)]
 
         self.TXset = self.set_transmissions()
 
-        # add support for multiple gateways in the future
-        self.gateway = LoRaGateway(CR, timeGranularity, freqGranularity, use_earlydrop, use_earlydecode,
-                                   use_headerdrop, numDecoders, self.baseFreq, collision_method)
+        self.builder = MatrixBuilder(numOCW, self.frequencySlots, simTime, self.baseFreq,
+                                     freqGranularity, timeGranularity, self.headerSlots, self.dtypes)
+
+        # every gateway has its own decoders, the first one is the reference gateway
+        self.gateways = [LoRaGateway(CR, timeGranularity, freqGranularity, use_earlydrop, use_earlydecode,
+                                     use_headerdrop, numDecoders, self.baseFreq, collision_method, self.dtypes,
+                                     scheduler) for _ in range(numGateways)]
+        self.gateway = self.gateways[0]
         
         self.fhsLocator = FHSLocator(self.simTime, self.numHeaders, self.timeGranularity, self.freqGranularity,
                                      self.freqPerSlot, self.headerSlots, max_packet_duration, self.baseFreq)
@@ -89,25 +171,391 @@ class LoRaNetwork():
 
     def set_transmissions(self) -> list[LRFHSSTransmission]:
 
+        if self.traffic == "bulk":
+            return self.get_bulk_transmissions()
+
+        if self.traffic != "nodes":
+            raise Exception(f"Invalid traffic generator '{self.traffic}'")
+
         transmissions = []
         node : LoRaNode
         for node in self.nodes:
             transmissions += node.get_transmissions(self.FHSfam)
 
-        sorted_txs = sorted(transmissions)
+        # stable sort by start slot, same order as sorted(transmissions)
+        order = np.argsort([tx.startSlot for tx in transmissions], kind='stable')
+        sorted_txs = [transmissions[i] for i in order]
         #for tx in sorted_txs: print(tx)
 
         return sorted_txs
     
 
+    def get_bulk_transmissions(self) -> list[LRFHSSTransmission]:
+        """
+        Same traffic model as LoRaNode.get_transmissions, one transmission per node, with the
+        OCW, start slot, payload size, sequence, distance and time offset of all nodes drawn
+        at once from the traffic generator. The doppler shift of every header/fragment is
+        computed in a single call and the transmissions are sorted by start slot
+        """
+
+        rng = self._traffic_rng
+        N = self.numNodes
+
+        ocw = rng.integers(0, self.numOCW, N)
+        startSlot = rng.integers(0, self.startLimit, N)
+
+        if self.CR == 1:
+            payload_size = rng.integers(13, 58, N)  # [8-31[ fragments
+            numHeaders = 3
+
+        elif self.CR == 2:
+            payload_size = rng.integers(29, 118, N) # [8-31[ fragments
+            numHeaders = 2
+
+        else:
+            raise Exception(f"Invalid coding rate '{self.CR}'")
+
+        # LoRaNode.numHops
+        length_bits = ((payload_size + 2) * 8 + 6) * (3 / self.CR)
+        numFragments = ((length_bits + 47) // 48).astype(int)
+        lengths = numFragments + numHeaders
+
+        seqid = rng.integers(0, len(self.FHSfam.FHSfam), N)
+
+        dis2sat = rng.uniform(SAT_H, SAT_RANGE, N)
+        tau = self.doppler.visibility_time(dis2sat)
+
+        # bounds cross for short visibility times, drawn as random.uniform does
+        low, high = -tau + MAX_FRM_TM, tau - MAX_FRM_TM
+        time = low + (high - low) * rng.random(N)
+
+        # doppler shift decreases as the satellites moves as seeen from the nodes
+        txidx, _, hopOffset, _ = get_hop_times(np.zeros(N), lengths, numHeaders, HDR_TIME, FRG_TIME)
+        doppler = self.doppler.shift(time[txidx] - hopOffset)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        transmissions = []
+        for i in np.argsort(startSlot, kind='stable').tolist():
+
+            node = self.nodes[i]
+            node.sent_packets += 1
+            node.sent_payload_bytes += int(payload_size[i])
+
+            sequence = self.FHSfam.FHSfam[seqid[i]][:lengths[i]]
+            tx = LRFHSSTransmission(node.id, node.id, int(startSlot[i]), int(ocw[i]), numHeaders,
+                                    int(payload_size[i]), int(numFragments[i]), sequence, int(seqid[i]),
+                                    float(dis2sat[i]), doppler[offsets[i] : offsets[i+1]].tolist(),
+                                    node.TXpower_dB)
+            transmissions.append(tx)
+
+        return transmissions
+
+
+    @property
+    def TXset(self) -> list[LRFHSSTransmission]:
+        return self._TXset
+
+
+    @TXset.setter
+    def TXset(self, transmissions: list[LRFHSSTransmission]) -> None:
+        """
+        Every new transmission set gets a new version, invalidating cached matrices and hop tables
+        """
+        self._TXset = transmissions
+        self.TXversion += 1
+        self.cleanup()
+        self._hop_tables.clear()
+        self._gateway_TXsets.clear()
+        self._TXtables.clear()
+    
+
     def run(self, power: bool, dynamic: bool) -> None:
+        """
+        Decode the current TXset. Count matrices come from the get_rcvM cache, power matrices
+        are built with new noise on every call unless rcvM_cache_power is set, in which case
+        repeated runs over the same TXset reuse the first noise realization
+        """
         collision_matrix = self.get_rcvM(self.TXset, power, dynamic)
-        self.gateway.run(self.TXset, collision_matrix, dynamic)
+        self.gateway.run(self.TXset, collision_matrix, dynamic, table=self.get_hop_table(self.TXset, dynamic))
+
+
+    def run_streaming(self, power: bool, dynamic: bool, windowTime: int = None) -> None:
+        """
+        Same as run but the received matrix is never built for the whole simTime. Time is
+        advanced in steps of windowTime slots (max_packet_duration by default), the transmissions
+        starting in the step [w0, w0 + windowTime[ are decoded over a window matrix covering
+        [w0, w0 + windowTime + max_packet_duration[, which holds their complete spans and every
+        transmission overlapping them. The decoders free up times are carried between windows.
+
+        Count based results are identical to run. In power mode the noise of every window is
+        read from the lazy noise field at its absolute time slots, see get_noise_field, so
+        overlapping windows share the noise of their common slots.
+
+        Window matrices are always dense with their noise added, the only supported
+        rcvM_backend is "dense" and noise_mode only changes the noise storage of run.
+        """
+
+        if self.rcvM_backend != "dense":
+            raise Exception(f"Invalid received matrix backend '{self.rcvM_backend}' for streaming runs")
+
+        if windowTime is None:
+            windowTime = self.max_packet_duration
+
+        transmissions = self.TXset
+        startSlots = np.array([tx.startSlot for tx in transmissions], dtype=int)
+        table = self.get_hop_table(transmissions, dynamic)
+        firstHop = table.offsets
+
+        ocw, startFreq, endFreq, startTime, endTime, RXpower = self.builder.get_hops(transmissions, power,
+                                                                                     dynamic, table)
+
+        dtype = self.dtypes.power if power else self.dtypes.count
+        noiseField = self.get_noise_field() if power else None
+
+        freeUpTimes = None
+        for w0 in range(0, self.simTime, windowTime):
+            w1 = min(w0 + windowTime + self.max_packet_duration, self.simTime)
+
+            # transmissions to decode and transmissions that can reach the window (TXset is sorted)
+            lo, hi = np.searchsorted(startSlots, [w0, w0 + windowTime], side='left')
+            first = np.searchsorted(startSlots, w0 - self.max_packet_duration, side='right')
+            last = np.searchsorted(startSlots, w1, side='left')
+
+            if lo == hi:
+                continue
+
+            h0, h1 = firstHop[first], firstHop[last]
+            inWindow = (startTime[h0:h1] < w1) & (endTime[h0:h1] > w0)
+            sel = np.arange(h0, h1)[inWindow]
+
+            window = scatter_blocks((self.numOCW, self.frequencySlots, w1 - w0), ocw[sel], startFreq[sel],
+                                    endFreq[sel], startTime[sel] - w0, endTime[sel] - w0, RXpower[sel], dtype)
+
+            if power:
+                for c in range(self.numOCW):
+                    window[c] += noiseField.get_block(c, 0, self.frequencySlots, w0, w1)
+
+            rcvM = WindowedRcvM(window, w0)
+            freeUpTimes = self.gateway.run(transmissions[lo:hi], rcvM, dynamic, freeUpTimes, table.subset(lo, hi))
+
+
+    def run_parallel(self, power: bool, dynamic: bool, workers: int = None,
+                     executor: str = "process", decoder_split: list[int] = None) -> None:
+        """
+        Same as run but TXset is partitioned by OCW channel, transmissions never cross channels.
+        Every channel is simulated in a pool worker with its own (1, frequencySlots, simTime)
+        matrix and its own slice of the gateway decoders.
+
+        decoder_split gives the decoders of each OCW channel (an even split by default), it must
+        add up to numDecoders and give at least one decoder to every channel with transmissions.
+        Results are identical to run whenever the decoders of a channel are never all busy,
+        otherwise they follow the per channel split instead of the global first fit. In power
+        mode every channel reads its noise from its OCW channel of the same lazy noise field,
+        see get_noise_field.
+
+        Channel matrices are always dense, the only supported rcvM_backend is "dense".
+
+        executor is "process" (multiprocessing pool) or "thread" (thread pool).
+        """
+
+        if self.rcvM_backend != "dense":
+            raise Exception(f"Invalid received matrix backend '{self.rcvM_backend}' for parallel runs")
+
+        numDecoders = self.gateway.numDecoders
+        if decoder_split is None:
+            decoder_split = [numDecoders // self.numOCW + (c < numDecoders % self.numOCW) for c in range(self.numOCW)]
+
+        if len(decoder_split) != self.numOCW or sum(decoder_split) != numDecoders or min(decoder_split) < 0:
+            raise Exception(f"Invalid decoder split '{decoder_split}'")
+
+        # a channel without decoders would never track its transmissions
+        txPerChannel = np.bincount([tx.ocw for tx in self.TXset], minlength=self.numOCW)
+        if np.any((np.asarray(decoder_split) == 0) & (txPerChannel > 0)):
+            raise Exception(f"Invalid decoder split '{decoder_split}', channels with transmissions have no decoders")
+
+        if executor == "process":
+            pool = Pool(processes = workers)
+        elif executor == "thread":
+            pool = ThreadPool(processes = workers)
+        else:
+            raise Exception(f"Invalid executor '{executor}'")
+
+        builder = MatrixBuilder(1, self.frequencySlots, self.simTime, self.baseFreq, self.freqGranularity,
+                                self.timeGranularity, self.headerSlots, self.dtypes)
+
+        noiseField = self.get_noise_field() if power else None
+
+        # per channel copies of the transmissions remapped to OCW 0
+        channels = [[] for _ in range(self.numOCW)]
+        for tx in self.TXset:
+            chtx = copy.copy(tx)
+            chtx.ocw = 0
+            channels[tx.ocw].append(chtx)
+
+        bounds = np.concatenate(([0], np.cumsum(decoder_split)))
+        _input = []
+        for c in range(self.numOCW):
+            gateway = copy.copy(self.gateway)
+            gateway._decoders = self.gateway._decoders.subset(bounds[c], bounds[c+1])
+            gateway.numDecoders = decoder_split[c]
+            _input.append([gateway, builder, channels[c], None, power, dynamic,
+                           noiseField.get_channel(c) if power else None, self.noise_mode])
+
+        result = pool.map(_run_gateway, _input)
+        pool.close()
+        pool.join()
+
+        # put back the decoders returned by the workers, decoded copies mapped to TXset
+        for c, decoders in enumerate(result):
+            decoders.remap(self.TXset)
+            self.gateway._decoders.update(bounds[c], decoders)
+
+
+    def get_gateway_TXsets(self) -> list[list[LRFHSSTransmission]]:
+        """
+        Transmissions of TXset as seen by every gateway. The first gateway sees TXset, the others
+        see copies with the same traffic and their own node-satellite distance and doppler track,
+        drawn as in LoRaNode from the gateway generator. Computed once per TXset
+        """
+
+        if self.TXversion in self._gateway_TXsets:
+            return self._gateway_TXsets[self.TXversion]
+
+        TXsets = [self.TXset]
+        for _ in range(1, self.numGateways):
+
+            transmissions = []
+            for tx in self.TXset:
+
+                dis2sat = self._gateway_rng.uniform(SAT_H, SAT_RANGE)
+                tau = self.doppler.visibility_time(dis2sat)
+                low, high = -tau + MAX_FRM_TM, tau - MAX_FRM_TM
+                time = low + (high - low) * self._gateway_rng.random()
+
+                # headers and fragments times, doppler shift decreases as the satellite moves
+                hdr_frg_times = time - np.concatenate((np.arange(tx.numHeaders) * HDR_TIME,
+                                                       tx.numHeaders * HDR_TIME + np.arange(tx.numFragments) * FRG_TIME))
+
+                gtx = copy.copy(tx)
+                gtx.distance = dis2sat
+                gtx.dopplerShift = self.doppler.shift(hdr_frg_times).tolist()
+                transmissions.append(gtx)
+
+            TXsets.append(transmissions)
+
+        self._gateway_TXsets[self.TXversion] = TXsets
+        return TXsets
+
+
+    def run_gateways(self, power: bool, dynamic: bool, workers: int = None, executor: str = "process") -> None:
+        """
+        Simulate the reception of TXset at every gateway, each one in a pool worker with its own
+        received matrix and decoders. The gateways share the traffic and the time geometry of the
+        hops, only the frequency columns of the hop table are recomputed with their doppler shifts.
+        In power mode every gateway reads its noise from its own lazy noise field, see get_noise_field.
+        Gateway matrices are always dense, the only supported rcvM_backend is "dense".
+        executor is "process" or "thread".
+        """
+
+        if self.rcvM_backend != "dense":
+            raise Exception(f"Invalid received matrix backend '{self.rcvM_backend}' for parallel runs")
+
+        if executor == "process":
+            pool = Pool(processes = workers)
+        elif executor == "thread":
+            pool = ThreadPool(processes = workers)
+        else:
+            raise Exception(f"Invalid executor '{executor}'")
+
+        TXsets = self.get_gateway_TXsets()
+        table = self.get_hop_table(self.TXset, dynamic)
+
+        noiseFields = [self.get_noise_field() if power else None for _ in range(self.numGateways)]
+
+        _input = []
+        for g, gateway in enumerate(self.gateways):
+            gtable = table if g == 0 else table.retarget(TXsets[g])
+            _input.append([gateway, self.builder, TXsets[g], gtable, power, dynamic, noiseFields[g],
+                           self.noise_mode])
+
+        result = pool.map(_run_gateway, _input)
+        pool.close()
+        pool.join()
+
+        # put back the decoders returned by the workers, decoded copies mapped to the gateway TXsets
+        for g, decoders in enumerate(result):
+            decoders.remap(TXsets[g])
+            self.gateways[g]._decoders = decoders
+
+
+    def get_combined_decoded(self) -> list:
+        """
+        Macro diversity decoding, a transmission of TXset is decoded if any gateway decodes it.
+        Returns [tx, status] pairs, status 1 if any gateway decoded the payload, 0 for headers only
+        """
+
+        status = {}
+        for gateway in self.gateways:
+            for tx, pld_status in gateway.get_decoded():
+                status[tx.id] = max(status.get(tx.id, 0), pld_status)
+
+        return [[tx, status[tx.id]] for tx in self.TXset if tx.id in status]
+
+
+    def get_combined_outcomes(self) -> dict:
+        """
+        Macro diversity outcome of every transmission tracked by any gateway, by transmission id.
+        A transmission counts once with the best outcome of all gateways, in the order of
+        combined_outcome_rank, so decoded payloads and headers follow get_combined_decoded
+        """
+
+        rank = {outcome: k for k, outcome in enumerate(self.combined_outcome_rank)}
+
+        best = {}
+        for gateway in self.gateways:
+            for tx, outcome in gateway.get_outcomes():
+                if tx.id not in best or rank[outcome] < rank[best[tx.id]]:
+                    best[tx.id] = outcome
+
+        return best
+
+
+    def get_combined_count(self, outcome: int) -> int:
+        return sum(best == outcome for best in self.get_combined_outcomes().values())
+
+
+    def get_combined_tracked_txs(self) -> int:
+        return len(self.get_combined_outcomes())
+
+
+    def get_combined_decoded_hrd_pld(self) -> int:
+        return sum(pld_status for _, pld_status in self.get_combined_decoded())
+
+
+    def get_combined_decoded_bytes(self) -> int:
+        return sum(tx.payload_size for tx, pld_status in self.get_combined_decoded() if pld_status)
+
+
+    def get_combined_header_drop_packets(self) -> int:
+        return self.get_combined_count(Processor.HEADER_DROP)
+
+
+    def get_combined_decoded_hdr(self) -> int:
+        return self.get_combined_count(Processor.DECODED_HDR)
+
+
+    def get_combined_decodable_pld(self) -> int:
+        return self.get_combined_count(Processor.DECODABLE_PLD)
+
+
+    def get_combined_collided_hdr_pld(self) -> int:
+        return self.get_combined_count(Processor.COLLIDED_HDR_PLD)
 
 
     def restart(self) -> None:
 
-        self.gateway.restart()
+        for gateway in self.gateways:
+            gateway.restart()
         self.TXset = self.set_transmissions()
 
         node : LoRaNode
@@ -119,6 +567,22 @@ class LoRaNetwork():
     # TIME-FREQ MATRIX GENERATOR METHODS
     ####################################
 
+    def get_hop_table(self, transmissions: list[LRFHSSTransmission], dynamic: bool) -> HopTable:
+        """
+        Per hop geometry of the given transmissions, computed once per TXset and doppler mode
+        and shared by the matrix builders and the gateway
+        """
+
+        if transmissions is not self.TXset:
+            return self.builder.get_hop_table(transmissions, dynamic)
+
+        key = (self.TXversion, dynamic)
+        if key not in self._hop_tables:
+            self._hop_tables[key] = self.builder.get_hop_table(transmissions, dynamic)
+
+        return self._hop_tables[key]
+
+
     def get_rcvM(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool) -> np.ndarray:
         """
         Create received matrix from given transmissions set in 4 ways.
@@ -128,57 +592,215 @@ class LoRaNetwork():
 
         The power flag on will output a matrix based on received power.
         When the power flag is off, the output matrix is based on counts.
+
+        Matrices of the current TXset are cached per (TXversion, power, dynamic) and
+        returned read-only, copy them before modifying. The least recently used
+        matrix is evicted when more than rcvM_cache_size are stored. The cache also
+        lets run() and get_predecoded_data() reuse the same memory mapped file,
+        call cleanup() to delete the files once the simulation is over.
+
+        Power matrices include their noise, so they are only cached when rcvM_cache_power
+        is set, otherwise every call draws a new noise realization.
         """
 
-        # count based received matrix
-        RXpower = 1
-        rcvM = np.zeros((self.numOCW, self.frequencySlots, self.simTime))
+        if transmissions is not self.TXset or self.rcvM_cache_size <= 0 \
+                or (power and not self.rcvM_cache_power):
+            return self.build_rcvM(transmissions, power, dynamic)
 
-        # power based received matrix
-        if power: 
-            rcvM = np.random.rayleigh(1, (self.numOCW, self.frequencySlots, self.simTime))
-            rcvM = (rcvM / np.linalg.norm(rcvM)) * np.sqrt(dBm2mW(AWGN_VAR_DB))
+        key = (self.TXversion, power, dynamic)
+        if key in self._rcvM_cache:
+            self._rcvM_cache.move_to_end(key)
+            return self._rcvM_cache[key]
 
-        # add transmissions to received matrix
-        for tx in transmissions:
+        rcvM = self.build_rcvM(transmissions, power, dynamic)
+        if isinstance(rcvM, np.ndarray):
+            rcvM.flags.writeable = False
 
-            dopplershift = round(tx.dopplerShift[0] / self.freqPerSlot)
+        self._rcvM_cache[key] = rcvM
+        while len(self._rcvM_cache) > self.rcvM_cache_size:
+            _, evicted = self._rcvM_cache.popitem(last=False)
+            self.close_rcvM(evicted)
 
-            time = tx.startSlot
-            for fh, obw in enumerate(tx.sequence):
+        return rcvM
 
-                # variable doppler shift per header / fragment
-                if dynamic:
-                    dopplershift = round(tx.dopplerShift[fh] / self.freqPerSlot)
 
-                startFreq = self.baseFreq + obw * self.freqGranularity + dopplershift
-                endFreq = startFreq + self.freqGranularity
+    def build_rcvM(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool) -> np.ndarray:
+        """
+        Create received matrix from given transmissions set, see get_rcvM
+        """
 
-                # power based received matrix
-                if power:
-                    carrier = OCW_FC + startFreq * self.freqPerSlot
-                    RXpower = dBm2mW(GAIN_TX) * dBm2mW(GAIN_RX) * dBm2mW(tx.power) \
-                            * get_FS_pathloss(tx.distance, carrier)
+        if self.rcvM_backend == "sparse":
+            return self.get_sparse_rcvM(transmissions, power, dynamic)
 
-                # write header
-                if fh < tx.numHeaders:
-                    endTime = time + self.headerSlots
-                    rcvM[tx.ocw, startFreq : endFreq, time : endTime] += (self.header * RXpower)
+        if self.rcvM_backend == "memmap":
+            return self.get_memmap_rcvM(transmissions, power, dynamic)
 
-                # write fragment
-                else:
-                    endTime = time + self.timeGranularity
-                    rcvM[tx.ocw, startFreq : endFreq, time : endTime] += (self.fragment * RXpower)
-                
-                time = endTime
+        if self.rcvM_backend == "overlap":
+            return self.get_overlap_rcvM(transmissions, power, dynamic)
+
+        if self.rcvM_backend != "dense":
+            raise Exception(f"Invalid received matrix backend '{self.rcvM_backend}'")
+
+        # count or power based received matrix of the given transmissions
+        rcvM = self.builder.get_rcvM(transmissions, power, dynamic, self.get_hop_table(transmissions, dynamic))
+
+        if not power:
+            return rcvM
+
+        if self.noise_mode == "lazy":
+            return NoisyRcvM(rcvM, self.get_noise_field())
+
+        # add noise to power based received matrix, drawn per OCW to avoid a float64 copy
+        noise = np.empty(rcvM.shape, dtype=self.dtypes.power)
+        for ocw in range(self.numOCW):
+            noise[ocw] = np.random.rayleigh(1, (self.frequencySlots, self.simTime))
+        rcvM += (noise / np.linalg.norm(noise)) * np.sqrt(dBm2mW(AWGN_VAR_DB)).astype(self.dtypes.power)
+
+        return rcvM
+
+
+    def get_noise_field(self, seed: int = None) -> NoiseField:
+        """
+        Lazy rayleigh noise layer of the power based received matrix, normalized with the
+        expected norm of the dense noise matrix. The seed is drawn from np.random if not given,
+        so seeded simulations stay reproducible
+        """
+
+        shape = (self.numOCW, self.frequencySlots, self.simTime)
+        noiseScale = np.sqrt(dBm2mW(AWGN_VAR_DB) / (2 * np.prod(shape)))
+
+        if seed is None:
+            seed = int(np.random.randint(2**62))
+
+        return NoiseField(shape, noiseScale, seed, self.dtypes.power)
+
+
+    def get_sparse_rcvM(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool) -> SparseRcvM:
+        """
+        Same as get_rcvM but each header/fragment is stored as a rectangle in a SparseRcvM,
+        dense blocks are only created for the slices queried by the gateway and the FHS locator.
+
+        In power mode the noise of the queried blocks is read from the lazy noise field,
+        see get_noise_field, so every query of a slot returns the same value.
+        """
+
+        shape = (self.numOCW, self.frequencySlots, self.simTime)
+        rcvM = SparseRcvM(shape, self.get_noise_field() if power else None)
+
+        table = self.get_hop_table(transmissions, dynamic)
+        for hop in zip(*self.builder.get_hops(transmissions, power, dynamic, table)):
+            rcvM.add(*hop)
 
         return rcvM
+
+
+    def get_overlap_rcvM(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool) -> OverlapRcvM:
+        """
+        Same as get_rcvM but no matrix is built, the gateway finds the header/fragment rectangles
+        overlapping each hop with a sweep over time and computes counts or power from them.
+
+        In power mode the noise is always the lazy noise field, see get_noise_field.
+        """
+
+        shape = (self.numOCW, self.frequencySlots, self.simTime)
+        table = self.get_hop_table(transmissions, dynamic)
+        hops = self.builder.get_hops(transmissions, power, dynamic, table)
+
+        if power:
+            return OverlapRcvM(shape, hops, self.get_noise_field(), self.dtypes.power)
+
+        return OverlapRcvM(shape, hops, None, self.dtypes.count)
+
+
+    def get_memmap_rcvM(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool) -> MemmapRcvM:
+        """
+        Same as get_rcvM but the matrix is written chunk by chunk along time into a memory
+        mapped file in scratch_dir, only one dense chunk is held in memory at a time.
+
+        In power mode the noise of every chunk is drawn first and then normalized
+        with the norm of the whole noise matrix, as in the dense matrix. With
+        noise_mode "lazy" the chunks are filled from the lazy noise field instead.
+        """
+
+        shape = (self.numOCW, self.frequencySlots, self.simTime)
+        dtype = self.dtypes.power if power else self.dtypes.count
+        rcvM = MemmapRcvM(shape, dtype, self.memmap_chunk, self.scratch_dir)
+
+        table = self.get_hop_table(transmissions, dynamic)
+        ocw, startFreq, endFreq, startTime, endTime, RXpower = self.builder.get_hops(transmissions, power,
+                                                                                     dynamic, table)
+
+        if power and self.noise_mode == "lazy":
+            noiseField = self.get_noise_field()
+            for k in range(rcvM.numChunks):
+                c0, c1 = rcvM.get_chunk_limits(k)
+                for c in range(self.numOCW):
+                    rcvM.get_chunk(k)[c, :, : c1 - c0] = noiseField.get_block(c, 0, self.frequencySlots, c0, c1)
+
+            noiseScale = 1
+
+        elif power:
+            sumsq = 0
+            for k in range(rcvM.numChunks):
+                c0, c1 = rcvM.get_chunk_limits(k)
+                noise = np.random.rayleigh(1, (self.numOCW, self.frequencySlots, c1 - c0))
+                rcvM.get_chunk(k)[:, :, : c1 - c0] = noise
+                sumsq += np.sum(noise**2)
+
+            noiseScale = np.sqrt(dBm2mW(AWGN_VAR_DB)) / np.sqrt(sumsq)
+
+        for k in range(rcvM.numChunks):
+            c0, c1 = rcvM.get_chunk_limits(k)
+            chunk = rcvM.get_chunk(k)[:, :, : c1 - c0]
+
+            # hops overlapping the chunk, time relative to the chunk start
+            inChunk = (startTime < c1) & (endTime > c0)
+            block = scatter_blocks((self.numOCW, self.frequencySlots, c1 - c0), ocw[inChunk],
+                                   startFreq[inChunk], endFreq[inChunk], startTime[inChunk] - c0,
+                                   endTime[inChunk] - c0, RXpower[inChunk], dtype)
+
+            if power:
+                chunk *= dtype.type(noiseScale)
+                chunk += block
+            else:
+                chunk[...] = block
+
+        rcvM.flush()
+        return rcvM
+
+
+    def cleanup(self) -> None:
+        """
+        Drop all cached received matrices and delete their memory mapped files
+        """
+
+        for rcvM in self._rcvM_cache.values():
+            self.close_rcvM(rcvM)
+
+        self._rcvM_cache.clear()
+
+
+    def close_rcvM(self, rcvM) -> None:
+        """
+        Delete the memory mapped file of a received matrix dropped from the cache
+        """
+        if isinstance(rcvM, MemmapRcvM):
+            rcvM.close()
+
+
+    def get_spectrogram(self, transmissions: list[LRFHSSTransmission], power: bool, dynamic: bool) -> Spectrogram:
+        """
+        Dense received matrix of the given transmissions that can be updated in place
+        with add/remove of single transmissions, noise is not included in power mode
+        """
+        rcvM = self.builder.get_rcvM(transmissions, power, dynamic, self.get_hop_table(transmissions, dynamic))
+        return Spectrogram(self.builder, rcvM, power, dynamic, transmissions)
     
 
     def get_OCWchannel_occupancy(self) -> float:
 
         transmissions = self.TXset
-        count_dynamic_rcvM = self.get_rcvM(transmissions, power=False, dynamic=True)[0]
+        count_dynamic_rcvM = np.array(self.get_rcvM(transmissions, power=False, dynamic=True)[0])
         count_dynamic_rcvM[count_dynamic_rcvM > 1] = 1
 
         fslots, tslots = count_dynamic_rcvM.shape
@@ -204,44 +826,60 @@ class LoRaNetwork():
         count_dynamic_rcvM = self.get_rcvM(transmissions, power=False, dynamic=True)
 
         # predecode headers
-        self.gateway.predecode(transmissions, count_dynamic_rcvM, dynamic=True)
-        decoded_headers = self.gateway.get_decoded_headers()
-        decoded_m = self.get_rcvM(decoded_headers, power=False, dynamic=True)
+        self.gateway.predecode(transmissions, count_dynamic_rcvM, dynamic=True,
+                               table=self.get_hop_table(transmissions, True))
+        collided_TXset = self.get_collided_TXset()
+
+        # dense signed copies of the first OCW channel only
+        signed = np.result_type(self.dtypes.count, np.int16)
+        counts = np.array(count_dynamic_rcvM[0], dtype=signed)
+
+        # decoded headers matrix, received matrix without the transmissions with collided headers
+        decoded_m = Spectrogram(self.builder, counts.copy()[np.newaxis], power=False, dynamic=True)
+        decoded_m.apply([(tx, -1) for tx in collided_TXset if tx.ocw == 0])
+        decoded = decoded_m.matrix[0]
 
         # 3-value - noise (0), signal (1), interference (2)
-        value3_matrix = count_dynamic_rcvM.copy()[0]
+        value3_matrix = counts.copy()
         value3_matrix[value3_matrix > 2] = 2
 
         # interference, noise/signal (0), interference (2)
-        interference = count_dynamic_rcvM.copy()[0]
+        interference = counts.copy()
         interference[interference > 2] = 2
         interference[interference < 2] = 0
 
         # detected/received difference matrix
-        diff = np.subtract(value3_matrix, decoded_m[0])
+        diff = np.subtract(value3_matrix, decoded)
         diff = np.add(diff, interference)
         diff[diff > 1] = 1
 
-        collided_TXset = self.get_collided_TXset()
+        # the FHS locator only looks for signal slots
+        if self.dtypes.binary == bool:
+            diff = diff == 1
 
         return collided_TXset, diff
     
 
+    def get_TXtable(self) -> TransmissionTable:
+        """
+        Columnar table of TXset, indexing it returns the TXset objects. Computed once per TXset
+        """
+
+        if self.TXversion not in self._TXtables:
+            self._TXtables[self.TXversion] = TransmissionTable.from_transmissions(self.TXset)
+
+        return self._TXtables[self.TXversion]
+
+
     def get_collided_TXset(self) -> list[LRFHSSTransmission]:
 
-        TXsetids = [tx.id for tx in self.TXset]
         decoded_headers = self.gateway.get_decoded_headers()
-        decoded_headers_ids = [tx.id for tx in decoded_headers]
+        collided = ~self.get_TXtable().isin(decoded_headers)
 
-        collidedTXset = []
-        for i, txid in enumerate(TXsetids):
-            if txid not in decoded_headers_ids:
-                collidedTXset.append(self.TXset[i])
-        
-        return collidedTXset
+        return [self.TXset[i] for i in np.flatnonzero(collided)]
 
             
-    def exhaustive_search(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray):
+    def exhaustive_search(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray, method: str = None):
 
         # create tx list in the form (time, seqid, seqlength)
         trueTXs = []
@@ -251,14 +889,27 @@ class LoRaNetwork():
         
         self.fhsLocator.set_RXmatrix(rcvM)
 
+        if self.template_dir is not None and self.fhsLocator.bank is None:
+            region = getattr(self.FHSfam, 'regionDR', None)
+            self.fhsLocator.set_template_bank(self.FHSfam.FHSfam, self.familyname, region, self.template_dir)
+
         start = time.time()
-        estTXs = self.fhsLocator.get_estTXs_parallel(self.FHSfam.FHSfam)
+        estTXs = self.fhsLocator.get_estTXs_parallel(self.FHSfam.FHSfam, method or self.locator)
         solve_time = time.time()-start
 
         # self.printknapSack(self.numNodes, Tp, RXbinary_matrix)
         tp, fp, fn, lenmatch, minlenerr = self.fhsLocator.get_metrics2(trueTXs, estTXs)
 
         return tp, fp, fn, solve_time, lenmatch, minlenerr
+
+
+    def compare_locators(self, transmissions: list[LRFHSSTransmission], rcvM: np.ndarray,
+                         methods: tuple = ("vectorized", "matched")) -> dict:
+        """
+        Detection quality of several FHS locator methods over the same received matrix,
+        (tp, fp, fn, solve_time, lenmatch, minlenerr) per method as in exhaustive_search
+        """
+        return {method: self.exhaustive_search(transmissions, rcvM, method) for method in methods}
     
 
     ######################################
@@ -274,7 +925,8 @@ class LoRaNetwork():
         seq = self.FHSfam.FHSfam[tx[1]][:tx[2]]
         ds = tx[3] #dopplerShift = self.estimateDynamicDoppler(tx[3])
 
-        auxM = np.zeros(Mp.shape)
+        # only the hops of tx are written over a copy of Mp
+        newMp = np.array(Mp, dtype=bool)
         for fh, obw in enumerate(seq):
 
             startFreq = self.baseFreq + obw * self.freqGranularity + ds
@@ -283,17 +935,15 @@ class LoRaNetwork():
             # write header
             if fh < self.numHeaders:
                 endTime = time + self.headerSlots
-                auxM[startFreq : endFreq, time : endTime] += self.header
 
             # write fragment
             else:
                 endTime = time + self.timeGranularity
-                auxM[startFreq : endFreq, time : endTime] += self.fragment
-            
+
+            newMp[startFreq : endFreq, time : endTime] = True
             time = endTime
 
-        boolauxM = np.array(auxM, dtype=bool)
-        return np.logical_or(Mp, boolauxM)
+        return newMp
 
 
     def get_ToverM_fitness(self, M, tx, Mp):
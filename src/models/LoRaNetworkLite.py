@@ -1,5 +1,8 @@
 import numpy as np
 from src.base.Population import Node, Population
+from src.base.MatrixBuilder import scatter_blocks
+from src.base.HopTable import get_hop_times
+from src.base.DtypePolicy import DtypePolicy
 
 class LoRaNetworkLite():
     """
@@ -16,6 +19,7 @@ class LoRaNetworkLite():
         seq_length (int): The sequence length.
         CR (int): Coding rate
         granularity(int): internal time slot subdivisions  
+        dtype_policy (str): data types of the collision matrix, "default" / "compact" / "compact16"
 
     Methods:
         get_packet_collision_rate(): calculate the packet collision rate 
@@ -23,9 +27,10 @@ class LoRaNetworkLite():
     """
 
     def __init__(self, simTime, familyname, numGrids, numOCW, numOBW, numNodes,
-                 numFragments, CR, granularity) -> None:
+                 numFragments, CR, granularity, dtype_policy="default") -> None:
         
         self.simTime = simTime
+        self.dtypes = DtypePolicy.get_policy(dtype_policy)
         self.numOCW = numOCW
         self.numOBW = numOBW
         self.granularity = granularity
@@ -116,23 +121,32 @@ class LoRaNetworkLite():
     
 
     def get_collision_matrix(self) -> np.ndarray:
+        """
+        Count matrix of the population hops, hops outside the
+        (numOCW, numOBW, simTime) matrix raise IndexError
+        """
 
-        collision_matrix = np.zeros((self.numOCW, self.numOBW, self.simTime))
-        
         node : Node
-        for node in self.population.nodes:
+        nodes = self.population.nodes
+        header_slots = int(self.granularity * 7 / 3)
 
-            time = node.startSlot
-            for fh, obw in enumerate(node.sequence):
+        shape = (self.numOCW, self.numOBW, self.simTime)
+        if len(nodes) == 0:
+            return np.zeros(shape, dtype=self.dtypes.count)
 
-                used_timeslots = self.granularity # write fragment
-                if fh < self.header_replicas:     # write header
-                    used_timeslots = int(self.granularity * 7 / 3)
+        lengths = [len(node.sequence) for node in nodes]
+        startSlots = [node.startSlot for node in nodes]
+        nodeidx, _, startTime, endTime = get_hop_times(startSlots, lengths, self.header_replicas,
+                                                       header_slots, self.granularity)
 
-                for g in range(used_timeslots):
-                    collision_matrix[node.ocw][obw][time + g] += 1
+        obw = np.concatenate([node.sequence for node in nodes]).astype(int)
+        ocw = np.array([node.ocw for node in nodes])[nodeidx]
 
-                time += used_timeslots
+        # scatter_blocks clips the hops, out of range slots raise as the slot by slot writes did
+        outside = (ocw >= self.numOCW) | (obw >= self.numOBW) | (endTime > self.simTime)
+        if outside.any():
+            k = np.flatnonzero(outside)[0]
+            raise IndexError(f"Hop ({ocw[k]}, {obw[k]}, {startTime[k]}:{endTime[k]}) out of bounds "
+                             f"for collision matrix of shape {shape}")
 
-        return collision_matrix
-    
\ No newline at end of file
+        return scatter_blocks(shape, ocw, obw, obw + 1, startTime, endTime, 1, self.dtypes.count)